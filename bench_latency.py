@@ -0,0 +1,219 @@
+"""
+Headless end-to-end latency benchmark.
+
+Runs the real assistant pipeline stages (VAD endpointing, whisper transcription, the
+Gemini streaming client, sentence splitting, the conversation context) with the other
+external dependencies replaced by local stand-ins from stand_ins.py: WAV fixtures are
+fed through a fake audio device, the wake word is a fake detector, Gemini is a local
+HTTP server, and Edge TTS and the speakers are fake producers/consumers with
+configurable delays.
+
+    python bench_latency.py --fixtures recordings/ --cycles 20
+    python bench_latency.py --fake-stt --threshold reply.p95=900
+
+Transcription needs the whisper model and whisper-server or whisper-cli, plus fixtures
+with real speech. --fake-stt replaces whisper with a fixed-delay stand-in that returns
+each fixture's transcript (a .txt next to the 16-bit WAV); without fixtures it then
+uses a synthetic utterance. Exits with status 1 when a threshold is exceeded or a
+cycle does not complete.
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+from stand_ins import (FakeAudioDevice, FakeGeminiServer, FakeSpeaker, FakeSynthesizer,
+                       FakeTranscriber, FakeWakeDetector, load_wav_pcm)
+
+DEFAULT_TRANSCRIPT = "What's the weather like today?"
+
+# stage.percentile -> maximum milliseconds
+DEFAULT_THRESHOLDS = {
+    "reply.p95": 1500,        # Recording finished -> first audio
+    "first_audio.p95": 1000,  # Gemini request -> first audio
+    "stt.p95": 1500,          # Not checked by default with --fake-stt
+}
+
+
+def synthetic_utterance(rate, seconds=1.6, lead_in=0.3):
+    """Voiced, syllable-modulated tone that the energy VAD treats as speech"""
+    samples = array("h", bytes(int(rate * lead_in) * 2))
+    for i in range(int(rate * seconds)):
+        t = i / rate
+        envelope = 0.55 + 0.45 * math.sin(2 * math.pi * 4 * t)
+        voice = math.sin(2 * math.pi * 150 * t) + 0.5 * math.sin(2 * math.pi * 300 * t) \
+            + 0.25 * math.sin(2 * math.pi * 450 * t)
+        samples.append(int(5000 * envelope * voice / 1.75))
+    return samples.tobytes()
+
+
+def load_fixtures(paths, rate):
+    """[(name, pcm, transcript)] for WAV files or directories of them"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.wav"))) if os.path.isdir(path) else [path])
+    fixtures = []
+    for path in files:
+        transcript_path = os.path.splitext(path)[0] + ".txt"
+        transcript = DEFAULT_TRANSCRIPT
+        if os.path.exists(transcript_path):
+            with open(transcript_path, "r", encoding="utf-8") as f:
+                transcript = f.read().strip() or DEFAULT_TRANSCRIPT
+        fixtures.append((os.path.basename(path), load_wav_pcm(path, rate), transcript))
+    return fixtures or [("synthetic", synthetic_utterance(rate), DEFAULT_TRANSCRIPT)]
+
+
+def cycle_metrics(record):
+    """Stage durations for one traced cycle, plus end-to-end figures derived from span offsets"""
+    spans = {span["name"]: span for span in record["spans"]}
+    metrics = {name: span["duration_ms"] for name, span in spans.items()}
+    metrics["cycle"] = record["total_ms"]
+    if "endpoint" in spans and "first_audio" in spans:
+        endpoint, first_audio = spans["endpoint"], spans["first_audio"]
+        reply = (first_audio["offset_ms"] + first_audio["duration_ms"]) - (endpoint["offset_ms"] + endpoint["duration_ms"])
+        metrics["reply"] = reply
+        # What the user feels: from when they stopped talking (includes the VAD hangover)
+        metrics["response"] = reply + endpoint.get("trailing_silence_ms", 0)
+    return metrics
+
+
+def parse_thresholds(items, fake_stt=False):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if fake_stt:
+        del thresholds["stt.p95"]  # It would only measure --stt-delay
+    for item in items or []:
+        key, _, value = item.partition("=")
+        stage, _, pct = key.partition(".")
+        if not stage or not pct.startswith("p") or not value:
+            raise SystemExit(f"Bad threshold {item!r}, expected STAGE.pNN=MS (e.g. reply.p95=900)")
+        thresholds[key] = float(value)
+    return thresholds
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark")
+    parser.add_argument("--fixtures", nargs="*", default=[], help="WAV files or directories of them")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--speed", type=float, default=1.0, help="audio feed and playback speed-up")
+    parser.add_argument("--fake-stt", action="store_true",
+                        help="replace whisper with a stand-in that returns the fixture transcript")
+    parser.add_argument("--stt-delay", type=float, default=0.25, help="stand-in transcription time (s), with --fake-stt")
+    parser.add_argument("--llm-first-chunk-delay", type=float, default=0.3)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.05)
+    parser.add_argument("--tts-first-chunk-delay", type=float, default=0.15)
+    parser.add_argument("--threshold", action="append", metavar="STAGE.pNN=MS",
+                        help="fail when a percentile exceeds MS (repeatable; overrides the defaults)")
+    parser.add_argument("--trace", default="", help="also write the cycle traces to this JSONL file")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds allowed per cycle")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    thresholds = parse_thresholds(args.threshold, args.fake_stt)
+    if not args.fake_stt and not args.fixtures:
+        raise SystemExit("Whisper needs real speech: pass --fixtures, or --fake-stt to use the synthetic utterance")
+
+    server = FakeGeminiServer(chunk_delay=args.llm_chunk_delay, first_chunk_delay=args.llm_first_chunk_delay).start()
+    os.environ["GEMINI_API_BASE"] = server.base_url  # Read by main at import time
+    # Keep benchmark turns out of the real conversation history, but still pay for the store
+    os.environ["ASSISTANT_CONVERSATION_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench-history-"), "conversation.db")
+    import main as assistant
+
+    transcriber = None  # The pipeline's default: transcribe_audio, streaming through whisper-server when present
+    if args.fake_stt:
+        transcriber = FakeTranscriber(delay=args.stt_delay)
+    elif not os.path.exists(assistant.MODEL_PATH) or not (
+            assistant.whisper_server.is_available() or os.path.exists(assistant.WHISPER_PATH)):
+        server.stop()
+        raise SystemExit(f"Whisper not found ({assistant.MODEL_PATH} and whisper-server or whisper-cli); "
+                         "pass --fake-stt to benchmark without it")
+    else:
+        print(f"📝 Whisper: {assistant._warm_whisper()}")
+
+    fixtures = load_fixtures(args.fixtures, assistant.SAMPLE_RATE)
+    device = FakeAudioDevice(speed=args.speed)
+    wake = FakeWakeDetector()
+    tracer = assistant.Tracer(path=args.trace)
+    pipeline = assistant.Pipeline(
+        mic=device, wake_detector=wake, transcriber=transcriber,
+        synthesizer=FakeSynthesizer(first_chunk_delay=args.tts_first_chunk_delay),
+        playback=FakeSpeaker(speed=args.speed), tracer=tracer)
+
+    records, completed = [], threading.Event()
+
+    def on_event(event, data):
+        if event == "turn_complete":
+            records.append(data["turn"].trace.to_dict())
+            completed.set()
+
+    pipeline.add_listener(on_event)
+    assistant.llm_client.start()
+    device.ensure_started()
+    pipeline.start()
+    time.sleep(0.5)  # Let the noise floor settle
+
+    print(f"🏁 Benchmarking {args.cycles} cycles over {len(fixtures)} fixture(s)")
+    started = time.perf_counter()
+    timeouts = 0
+    for cycle in range(args.cycles):
+        name, pcm, transcript = fixtures[cycle % len(fixtures)]
+        if transcriber is not None:
+            transcriber.expect(transcript)
+        completed.clear()
+        device.play(pcm, on_start=wake.trigger)
+        if not completed.wait(args.timeout):
+            print(f"❌ Cycle {cycle + 1} ({name}) did not finish within {args.timeout:.0f}s")
+            timeouts += 1
+            break
+        time.sleep(0.2)
+    pipeline.stop()
+    device.stop()
+    server.stop()
+
+    metrics = {}
+    for record in records:
+        for name, value in cycle_metrics(record).items():
+            metrics.setdefault(name, []).append(value)
+    outcomes = {}
+    for record in records:
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+
+    print(f"\n📊 {len(records)} cycles in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items()))
+    print(f"   {'stage':<12} {'n':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, values in metrics.items():
+        values.sort()
+        print(f"   {name:<12} {len(values):>4} {assistant._percentile(values, 50):>8.0f} "
+              f"{assistant._percentile(values, 95):>8.0f} {assistant._percentile(values, 99):>8.0f} {values[-1]:>8.0f}")
+
+    failures = []
+    for key, limit in thresholds.items():
+        stage, _, pct = key.partition(".")
+        values = metrics.get(stage)
+        if not values:
+            failures.append(f"{key}: no samples")
+            continue
+        value = assistant._percentile(values, float(pct[1:]))
+        status = "✅" if value <= limit else "❌"
+        print(f"{status} {key} = {value:.0f} ms (limit {limit:.0f} ms)")
+        if value > limit:
+            failures.append(f"{key} = {value:.0f} ms > {limit:.0f} ms")
+    failed_cycles = timeouts + sum(count for outcome, count in outcomes.items() if outcome != "completed")
+    if failed_cycles:
+        failures.append(f"{failed_cycles} cycle(s) did not complete")
+
+    if failures:
+        print("\n❌ Regression: " + "; ".join(failures))
+        return 1
+    print("\n✅ All thresholds met")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Process-pool workers for the GIF optimizer (python main.py --optimize-gifs).
+
+Kept apart from main.py so worker processes only import Pillow, not the assistant's
+keys, caches, conversation store and audio stack.
+"""
+import hashlib
+import os
+import time
+
+from PIL import Image, ImageSequence
+
+
+def decode_gif(path, size):
+    """Every frame of one GIF resized to RGB, each with a digest for duplicate detection.
+
+    GIF frames are deltas, so Pillow can only seek by decoding every earlier frame; one
+    sequential pass per file keeps decoding linear in the frame count.
+    """
+    started = time.process_time()
+    frames = []
+    with Image.open(path) as img:
+        for frame in ImageSequence.Iterator(img):
+            frame = frame.convert('RGBA').resize(size, Image.Resampling.LANCZOS)
+            # Composite onto black, the overlay background, so transparent pixels don't keep stray colours
+            frame = Image.alpha_composite(Image.new('RGBA', size, (0, 0, 0, 255)), frame).convert('RGB')
+            data = frame.tobytes()
+            frames.append((hashlib.blake2b(data, digest_size=16).digest(), data))
+    return frames, time.process_time() - started
+
+
+def quantize_gif_chunk(frames, size, palette):
+    """Map RGB frames onto the animation's shared palette"""
+    started = time.process_time()
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette(palette)
+    indices = [Image.frombytes('RGB', size, data).quantize(palette=palette_image, dither=Image.Dither.NONE).tobytes()
+               for data in frames]
+    return indices, time.process_time() - started
+
+
+def write_optimized_gif(output_path, size, palette, indices, durations):
+    """Encode palette-indexed frames as a looping GIF"""
+    started = time.process_time()
+    frames = []
+    for data in indices:
+        frame = Image.frombytes('P', size, data)
+        frame.putpalette(palette)
+        frames.append(frame)
+    tmp_path = output_path + ".part"
+    frames[0].save(tmp_path, format='GIF', save_all=True, append_images=frames[1:],
+                   duration=durations, loop=0, optimize=True)
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path), time.process_time() - started
@@ -1,23 +1,41 @@
 import os
 import json
+import atexit
 import requests
 import subprocess
+import shutil
 import wave
-import pyaudio
-import pvporcupine
+import io
+import math
+from array import array
 import threading
 import sys
 import platform
 import asyncio
-import edge_tts
-import uuid
+import hashlib
+from collections import OrderedDict, deque
+import re
+import queue
 import time
-from playsound import playsound
-from pystray import Icon, MenuItem, Menu
+import random
+import ctypes
+import mmap
+import struct
+import timeit
+import argparse
+import socket
+import sqlite3
+import importlib.util
+import contextlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image
 import tkinter as tk
 from tkinter import Label
 from PIL import ImageTk, Image as PILImage, ImageSequence
+# pyaudio, pvporcupine, edge_tts, playsound and pystray are imported where they are first
+# used, so the overlay can draw its first frame before they load (see warm_up)
+
+PROCESS_STARTED = time.perf_counter()  # Reference point for the time-to-ready report
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -27,9 +45,14 @@ ASSETS_DIR = os.path.join(BASE_DIR, "assets")
 GIFS_DIR = os.path.join(ASSETS_DIR, "gifs")
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 KEYS_DIR = os.path.join(BASE_DIR, "keys")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+TTS_CACHE_DIR = os.path.join(CACHE_DIR, "tts")
+FRAME_CACHE_DIR = os.path.join(CACHE_DIR, "frames")
+MEMORY_DIR = os.path.join(BASE_DIR, "memory")
 
 # Create directories if they don't exist
-for directory in [TEMP_DIR, ASSETS_DIR, GIFS_DIR, MODELS_DIR, KEYS_DIR]:
+for directory in [TEMP_DIR, ASSETS_DIR, GIFS_DIR, MODELS_DIR, KEYS_DIR, CACHE_DIR, TTS_CACHE_DIR, FRAME_CACHE_DIR,
+                  MEMORY_DIR]:
     os.makedirs(directory, exist_ok=True)
 
 # --- Load Keys ---
@@ -47,22 +70,83 @@ with open(GEMINI_KEY_FILE, "r") as f:
 with open(PORCUPINE_KEY_FILE, "r") as f:
     PORCUPINE_API_KEY = f.read().strip()
 
-API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={API_KEY}"
+# GEMINI_API_BASE can point at a local stand-in server (see stand_ins.py)
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com").rstrip("/")
+GEMINI_MODEL = "gemini-2.5-flash"
+API_URL = f"{GEMINI_API_BASE}/v1beta/models/{GEMINI_MODEL}:generateContent?key={API_KEY}"
+STREAM_API_URL = f"{GEMINI_API_BASE}/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={API_KEY}"
+
+# --- LLM HTTP client (pooled keep-alive connection) ---
+LLM_CONNECT_TIMEOUT = 5   # Seconds to establish a connection
+LLM_READ_TIMEOUT = 30     # Seconds to wait for response data
+LLM_DEADLINE = 45         # Overall budget per request, retries included
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BASE = 0.5      # Backoff base in seconds (full jitter)
+LLM_POOL_SIZE = 4
+LLM_IDLE_REWARM = 60      # Re-warm the connection after this many idle seconds
+LLM_USE_HTTP2 = False     # Requires: pip install "httpx[http2]"
+
+# Stream replies and speak them sentence by sentence while the rest is generated
+USE_STREAMING = True
+
+# --- Pipeline queues (bounded: a slow stage back-pressures the one before it) ---
+PIPELINE_SENTENCE_QUEUE = 4   # Reply sentences waiting for synthesis
+PIPELINE_SYNTH_AHEAD = 2      # Synthesized sentences waiting for playback
 
 # --- Audio & TTS Config ---
 SAMPLE_RATE = 16000
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
 CHUNK = 256
 
+# --- Shared microphone stream ---
+MIC_BUFFER_SECONDS = 10   # Ring buffer history shared by the wake word detector and recorder
+MIC_PREROLL_MS = 300      # Audio from before the wake word detection point given to the recorder
+MIC_READ_TIMEOUT = 1.0    # Seconds to wait for audio before treating the device as stalled
+
+# --- Voice activity detection (endpointing for record_audio) ---
+VAD_ENABLED = True
+VAD_MAX_SECONDS = 10            # Hard cap on a single command
+VAD_ONSET_TIMEOUT = 4           # Give up if no speech starts within this many seconds
+VAD_TRAILING_SILENCE_MS = 700   # Stop after this much silence following speech
+VAD_MIN_SPEECH_MS = 100         # Ignore clicks and bumps shorter than this
+VAD_ENERGY_THRESHOLD = 500      # Minimum RMS that can count as speech
+VAD_NOISE_MULTIPLIER = 3.0      # Speech must also be this far above the running noise floor
+VAD_PADDING_MS = 200            # Audio kept before speech onset and after speech end
+
 VOICE_NAME = "en-US-JennyNeural"
 TTS_RATE = "+10%"
 TTS_PITCH = "+10Hz"
 
 # --- Whisper Paths ---
 WHISPER_PATH = os.path.join(BASE_DIR, "whisper.cpp", "whisper-cli.exe")
+WHISPER_SERVER_PATH = os.path.join(BASE_DIR, "whisper.cpp", "whisper-server.exe")
 MODEL_PATH = os.path.join(MODELS_DIR, "ggml-tiny.en-q5_1.bin")
 
+# --- Resident Whisper server (keeps the model loaded between turns) ---
+WHISPER_SERVER_HOST = "127.0.0.1"
+WHISPER_SERVER_PORT = 8178
+WHISPER_SERVER_STARTUP_TIMEOUT = 30
+WHISPER_SERVER_REQUEST_TIMEOUT = 60
+WHISPER_SERVER_HEALTH_INTERVAL = 10
+WHISPER_SERVER_MAX_RESTARTS = 3
+WHISPER_SERVER_RESTART_RESET = 300   # Seconds of good health after which the restart budget refills
+
+# --- Streaming transcription (decodes while the user is still speaking) ---
+STREAMING_STT_ENABLED = True         # Needs the resident whisper-server; otherwise transcribes after recording
+STREAMING_STT_INTERVAL_MS = 500      # New audio needed before the next partial decode
+STREAMING_STT_MIN_SECONDS = 1.0      # Don't decode until this much audio is buffered
+STREAMING_STT_WINDOW_SECONDS = 8.0   # Committed segments older than this slide out of the decode window
+STREAMING_STT_TAIL_MS = 200          # A hypothesis is final once it covers this much audio past speech end
+
+# --- Batch transcription (python main.py --transcribe FILE_OR_DIR ...) ---
+TRANSCRIBE_DECODERS = 2               # Parallel whisper decoders; CPU cores are split evenly between them
+TRANSCRIBE_BASE_PORT = 8190           # Decoder servers listen on consecutive ports from here
+TRANSCRIBE_SHORT_CLIP_SECONDS = 4.0   # Clips shorter than this are batched into one decode
+TRANSCRIBE_BATCH_SECONDS = 12.0       # Upper bound on the audio in one batched decode
+TRANSCRIBE_BATCH_GAP_MS = 800         # Silence placed between batched clips so segments break there
+TRANSCRIBE_STRADDLE_MS = 100          # A segment overlapping two clips by more than this re-decodes both alone
+TRANSCRIBE_MAX_PENDING = 64           # Clips queued before submit() blocks until a decoder takes one
+
 # --- Porcupine keyword ---
 PORCUPINE_PPN = os.path.join(BASE_DIR, "hi_liebe.ppn")
 
@@ -79,10 +163,56 @@ if not os.path.exists(LISTENING_GIF):
 if not os.path.exists(SPEAKING_GIF):
     SPEAKING_GIF = os.path.join(GIFS_DIR, "speaking.gif")
 
+# --- GIF optimizer (python main.py --optimize-gifs) ---
+GIF_OPTIMIZE_SIZE = (180, 320)
+GIF_OPTIMIZE_FPS = 10
+GIF_OPTIMIZE_COLORS = 64                 # One palette shared by every frame of an animation
+GIF_OPTIMIZE_WORKERS = os.cpu_count() or 1
+GIF_OPTIMIZE_CHUNK_FRAMES = 16           # Frames per quantize task
+GIF_OPTIMIZE_MANIFEST = os.path.join(CACHE_DIR, "gif_optimize.json")  # Inputs/settings behind each output
+
+# --- Tracing (per-stage latency of every conversation cycle) ---
+TRACE_FILE = os.environ.get("ASSISTANT_TRACE_FILE", "")  # JSONL, one line per cycle; empty disables
+TRACE_WINDOW = 200        # Cycles kept for the rolling p50/p95/p99
+TRACE_REPORT_EVERY = 10   # Print the rolling percentiles every N cycles
+
+# --- Overlay animation ---
+ANIMATION_MIN_FRAME_MS = 20       # Floor for GIF frame durations (0/10 ms frames are common)
+ANIMATION_HIDDEN_POLL_MS = 500    # How often a hidden/minimized overlay checks if it is visible again
+OVERLAY_PHOTO_CACHE_FRAMES = 48   # Tk images kept alive at once (each is width*height*4 bytes)
+UI_EVENT_POLL_MS = 30             # How often the Tk thread drains state changes posted by other threads
+
 # --- Edge-TTS retry settings ---
 EDGE_TTS_TIMEOUT = 60
 EDGE_TTS_RETRIES = 3
 EDGE_TTS_BACKOFF = 1.0
+EDGE_TTS_HOST = "speech.platform.bing.com"  # Resolved during start-up warm-up
+TTS_MAX_CONCURRENCY = 3   # Synthesis jobs the TTS runtime runs at once
+
+# --- Hedged TTS (an offline voice races edge-tts when it is slow; needs pyttsx3) ---
+TTS_HEDGE_ENABLED = True
+TTS_HEDGE_DELAY_MS = 800   # Silence from edge-tts (once playback is waiting) before the local voice starts too
+TTS_DEADLINE_MS = 6000     # No audio from either engine by then: give up and print the text
+LOCAL_TTS_RATE = 190       # Words per minute for the local voice
+
+# --- Streaming TTS playback (needs ffmpeg; falls back to playsound without it) ---
+FFMPEG_PATH = shutil.which("ffmpeg") or os.path.join(BASE_DIR, "ffmpeg", "ffmpeg.exe")
+TTS_OUTPUT_RATE = 24000        # edge-tts default output is 24 kHz mono MP3
+PLAYBACK_BLOCK_BYTES = 2400    # 50 ms of PCM per output write (bounds stop latency)
+
+# --- TTS audio cache ---
+TTS_CACHE_MAX_BYTES = 50 * 1024 * 1024     # On-disk LRU budget
+TTS_CACHE_MEMORY_BYTES = 4 * 1024 * 1024   # In-memory LRU budget
+GEMINI_ERROR_REPLY = "Sorry babe, I couldn't think straight just now. Can you say that again?"
+# Synthesized at startup so these play instantly (split into the same sentence units replies use)
+TTS_PRESYNTH_PHRASES = [
+    "Hey Babe,",
+    "Sweetie,",
+    "Hey Babe, I missed you!",
+    GEMINI_ERROR_REPLY,
+]
+# A reply starting with one of these speaks it as its own unit, so the cached audio plays at once
+TTS_OPENERS = tuple(phrase for phrase in TTS_PRESYNTH_PHRASES if phrase.endswith(","))
 
 # --- Roleplay Prompt ---
 USE_CUSTOM_MESSAGE = True
@@ -97,14 +227,195 @@ CUSTOM_PROMPT = (
 )
 
 CONSTANT_TEXT = ""
-history = []
-MAX_MEMORY = 5
+
+# --- Conversation context (persona is sent once per request as a system instruction) ---
+CONTEXT_TOKEN_BUDGET = 1500        # Approximate tokens of recent turns sent with each request
+CONTEXT_SUMMARY_MAX_TOKENS = 250   # Cap for the running summary of older turns
+
+# --- Conversation store (every turn persisted; relevant older exchanges recalled into the prompt) ---
+CONVERSATION_DB = os.environ.get("ASSISTANT_CONVERSATION_DB") or os.path.join(MEMORY_DIR, "conversation.db")
+CONTEXT_LOAD_TURNS = 20            # Most recent turns loaded at startup (then fitted to the token budget)
+CONTEXT_RECALL_RESULTS = 3         # Older exchanges recalled per request when they share keywords with it
+CONTEXT_RECALL_MAX_TOKENS = 300    # Cap for recalled exchanges in the system instruction
+
+# --- Global state for wake word detection ---
+porcupine = None
+porcupine_lock = threading.Lock()
 
 # --- Global state for GIF window ---
 gif_window = None
 current_state = "idle"
 
 
+# -------------------------
+# Pre-rendered GIF Frame Cache
+# -------------------------
+class CompactFrames:
+    """One animation's frames as palette-indexed pixels packed into a single buffer.
+
+    Each frame is 1 byte per pixel plus a 768-byte palette, a quarter of RGBA. Frames are
+    composited onto black (the overlay background) before quantizing, so nothing visible
+    is lost by dropping alpha. The buffer can be bytes or a memory map of the frame cache.
+    """
+
+    PALETTE_BYTES = 768
+
+    def __init__(self, size, durations, palettes, indices):
+        self.size = tuple(size)
+        self.durations = durations
+        self.palettes = palettes
+        self.indices = indices
+        self.frame_bytes = self.size[0] * self.size[1]
+        self._keys = None
+
+    @classmethod
+    def from_images(cls, images, durations, size):
+        palettes, indices = bytearray(), bytearray()
+        for image in images:
+            if image.mode == "RGBA":
+                flat = PILImage.new("RGB", image.size, (0, 0, 0))
+                flat.paste(image, mask=image.getchannel("A"))
+            else:
+                flat = image.convert("RGB")
+            indexed = flat.quantize(256, dither=PILImage.Dither.NONE)
+            palette = bytes(indexed.getpalette()[:cls.PALETTE_BYTES])
+            palettes += palette.ljust(cls.PALETTE_BYTES, b"\0")
+            indices += indexed.tobytes()
+        return cls(size, list(durations), bytes(palettes), bytes(indices))
+
+    def __len__(self):
+        return len(self.durations)
+
+    @property
+    def nbytes(self):
+        return len(self.palettes) + len(self.indices)
+
+    def image(self, index):
+        """PIL image for one frame (built on demand, ready for ImageTk.PhotoImage)"""
+        start = index * self.frame_bytes
+        image = PILImage.frombuffer("P", self.size, self.indices[start:start + self.frame_bytes], "raw", "P", 0, 1)
+        image.putpalette(self.palettes[index * self.PALETTE_BYTES:(index + 1) * self.PALETTE_BYTES])
+        return image
+
+    def keys(self):
+        """Content digests so consecutive identical frames can be merged instead of redrawn"""
+        if self._keys is None:
+            keys = []
+            for i in range(len(self)):
+                digest = hashlib.blake2b(digest_size=16)
+                digest.update(self.palettes[i * self.PALETTE_BYTES:(i + 1) * self.PALETTE_BYTES])  # All 256 colours
+                digest.update(self.indices[i * self.frame_bytes:(i + 1) * self.frame_bytes])
+                keys.append(digest.digest())
+            self._keys = keys
+        return self._keys
+
+
+class FrameCache:
+    """Already-resized, palette-indexed frames on disk, memory-mapped on load.
+
+    File layout: header (magic, version, width, height, frame count), one uint32 duration
+    (ms) per frame, the frame palettes, then the packed pixel indices. Entries are keyed by
+    source path, mtime and target size, so editing a GIF or resizing the overlay misses.
+    """
+
+    MAGIC = b"LBFC"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHHI")
+
+    def __init__(self, cache_dir=FRAME_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path_for(self, gif_path, size):
+        st = os.stat(gif_path)
+        material = f"{os.path.abspath(gif_path)}|{st.st_mtime_ns}|{st.st_size}|{size[0]}x{size[1]}"
+        return os.path.join(self.cache_dir, hashlib.sha1(material.encode("utf-8")).hexdigest() + ".frames")
+
+    def load(self, gif_path, size):
+        """Return CompactFrames backed by a memory map, or None on a miss"""
+        try:
+            cache_path = self.path_for(gif_path, size)
+            with open(cache_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        magic, version, width, height, count = self.HEADER.unpack_from(mm, 0)
+        palettes_at = self.HEADER.size + 4 * count
+        indices_at = palettes_at + CompactFrames.PALETTE_BYTES * count
+        if magic != self.MAGIC or version != self.VERSION or (width, height) != tuple(size) \
+                or len(mm) != indices_at + width * height * count:
+            mm.close()
+            return None
+        durations = list(struct.unpack_from(f"<{count}I", mm, self.HEADER.size))
+        view = memoryview(mm)
+        return CompactFrames((width, height), durations, view[palettes_at:indices_at], view[indices_at:])
+
+    def store(self, gif_path, size, frames):
+        cache_path = self.path_for(gif_path, size)
+        tmp_path = cache_path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, size[0], size[1], len(frames)))
+            f.write(struct.pack(f"<{len(frames)}I", *frames.durations))
+            f.write(frames.palettes)
+            f.write(frames.indices)
+        os.replace(tmp_path, cache_path)
+
+
+frame_cache = FrameCache()
+
+
+def decode_gif_frames(gif_path, size):
+    """CompactFrames for a GIF resized to size, with per-frame durations (ms)"""
+    cached = frame_cache.load(gif_path, size)
+    if cached is not None:
+        return cached
+    images, durations = [], []
+    with PILImage.open(gif_path) as img:
+        for frame in ImageSequence.Iterator(img):
+            durations.append(int(frame.info.get("duration") or 100))
+            if frame.mode != 'RGBA':
+                frame = frame.convert('RGBA')
+            images.append(frame.resize(size, PILImage.Resampling.LANCZOS))
+    frames = CompactFrames.from_images(images, durations, size)
+    try:
+        frame_cache.store(gif_path, size, frames)
+        return frame_cache.load(gif_path, size) or frames
+    except OSError as e:
+        print(f"⚠️ Could not write frame cache: {e}")
+    return frames
+
+
+# -------------------------
+# UI Event Channel
+# -------------------------
+class UIEventChannel:
+    """Mailbox from worker threads to the Tk thread; a burst of posts collapses to the latest value per kind"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()  # kind -> (value, posted_at)
+        self.stats = {"posted": 0, "coalesced": 0, "delivered": 0}
+
+    def post(self, kind, value=None):
+        """Any thread: queue an event, replacing an undelivered one of the same kind"""
+        with self.lock:
+            self.stats["posted"] += 1
+            if kind in self.pending:
+                self.stats["coalesced"] += 1
+                del self.pending[kind]
+            self.pending[kind] = (value, time.monotonic())
+
+    def drain(self):
+        """Tk thread: take every pending event as (kind, value, posted_at)"""
+        with self.lock:
+            events = [(kind, value, posted_at) for kind, (value, posted_at) in self.pending.items()]
+            self.pending.clear()
+            self.stats["delivered"] += len(events)
+        return events
+
+
+ui_events = UIEventChannel()
+
+
 # -------------------------
 # GIF Overlay Window Class (OPTIMIZED)
 # -------------------------
@@ -139,68 +450,126 @@ class GifOverlay:
         self.frames = []
         self.current_frame = 0
         self.animation_id = None
-        self.delay = 60  # OPTIMIZED: 10 FPS (increased from 33ms)
+        self.delay = 100  # Frame duration (ms) for fallback frames; GIFs use their own
+        self.next_frame_at = None
+        self.displayed_key = None
+        self.displayed_photo = None  # Keeps the shown PhotoImage alive even if the LRU evicts it
+        self.photo_cache = OrderedDict()  # (state, frame index) -> PhotoImage, size-bounded LRU
+        self.animation_stats = {"rendered": 0, "dropped": 0, "identical": 0, "cpu_time": 0.0}
+        self.state_requested_at = None  # When the state now loading/shown was asked for
+        self.state_latencies = deque(maxlen=100)  # Seconds from request to first frame on screen
+        self.first_frame_shown = False
         
-        # Pre-load all GIFs to avoid loading delays during state changes
+        # "idle" is shown straight away; the other states decode in the background
         self.preloaded_gifs = {}
+        self.frame_durations = {}
+        self.frame_keys = {}
+        self.loaded_queue = queue.Queue()
+        self.pending_state = None
         self.preload_gifs()
         
         # Load initial GIF
         self.current_state = "idle"
         self.load_preloaded_gif("idle")
+        self.root.after(50, self.poll_loaded_gifs)
+        self.root.after(UI_EVENT_POLL_MS, self.poll_ui_events)
         
-    def preload_gifs(self):
-        """Pre-load all GIFs to avoid loading delays during state changes"""
-        print("🔄 Pre-loading all GIFs for instant state changes...")
-        
-        gif_paths = {
+    def gif_paths(self):
+        return {
             "idle": IDLE_GIF,
             "listening": LISTENING_GIF,
             "speaking": SPEAKING_GIF
         }
         
-        for state, path in gif_paths.items():
-            if os.path.exists(path):
-                print(f"   📥 Loading {state} GIF...")
-                frames = self.load_gif_frames(path)
-                self.preloaded_gifs[state] = frames
-                print(f"   ✅ Pre-loaded {len(frames)} frames for {state}")
-            else:
-                print(f"⚠️ GIF not found for {state}: {path}")
-                self.preloaded_gifs[state] = self.create_fallback_frames()
+    def preload_gifs(self):
+        """Load idle synchronously (from the frame cache when warm); decode the rest in the background"""
+        print("🔄 Loading idle GIF, other states load in the background...")
+        started = time.perf_counter()
+        self.install_frames("idle", self.read_state_frames("idle"))
+        print(f"   ✅ idle ready in {(time.perf_counter() - started)*1000:.0f} ms")
+        self.memory_report()
+        threading.Thread(target=self.load_remaining_gifs, daemon=True).start()
     
-    def load_gif_frames(self, gif_path):
-        """Load GIF frames without displaying them"""
-        frames = []
+    def read_state_frames(self, state):
+        """CompactFrames for a state, or None (safe to call off the Tk thread)"""
+        path = self.gif_paths()[state]
+        if not os.path.exists(path):
+            print(f"⚠️ GIF not found for {state}: {path}")
+            return None
         try:
-            img = PILImage.open(gif_path)
-            frame_count = 0
-            for frame in ImageSequence.Iterator(img):
-                if frame.mode != 'RGBA':
-                    frame = frame.convert('RGBA')
-                
-                # Resize to window size
-                frame_resized = frame.resize((self.window_width, self.window_height), PILImage.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(frame_resized)
-                frames.append(photo)
-                frame_count += 1
-            
-            print(f"      📊 {frame_count} frames loaded from {os.path.basename(gif_path)}")
+            frames = decode_gif_frames(path, (self.window_width, self.window_height))
+            frames.keys()  # Digest frames here rather than on the Tk thread
+            print(f"      📊 {len(frames)} frames loaded from {os.path.basename(path)}")
+            return frames
         except Exception as e:
             print(f"⚠️ Error loading GIF frames: {e}")
+            return None
+    
+    def load_remaining_gifs(self):
+        for state in self.gif_paths():
+            if state != "idle":
+                self.loaded_queue.put((state, self.read_state_frames(state)))
+    
+    def poll_loaded_gifs(self):
+        """Tk thread: install frames decoded in the background"""
+        try:
+            while True:
+                state, frames = self.loaded_queue.get_nowait()
+                self.install_frames(state, frames)
+                print(f"   ✅ Pre-loaded {len(self.preloaded_gifs[state])} frames for {state}")
+                if self.pending_state == state:
+                    self.pending_state = None
+                    self.load_preloaded_gif(state)
+        except queue.Empty:
+            pass
+        if len(self.preloaded_gifs) < len(self.gif_paths()):
+            self.root.after(50, self.poll_loaded_gifs)
+    
+    def install_frames(self, state, frames):
+        if not frames:
             frames = self.create_fallback_frames()
-        
-        return frames
+        self.preloaded_gifs[state] = frames
+        self.frame_keys[state] = frames.keys()
+        self.frame_durations[state] = [max(ANIMATION_MIN_FRAME_MS, d) / 1000 for d in frames.durations]
     
     def create_fallback_frames(self):
         """Create fallback frames when GIF loading fails"""
-        frames = []
+        size = (self.window_width, self.window_height)
         colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7']
-        for color in colors:
-            img = PILImage.new('RGB', (self.window_width, self.window_height), color)
-            photo = ImageTk.PhotoImage(img)
-            frames.append(photo)
-        return frames
+        images = [PILImage.new('RGB', size, color) for color in colors]
+        return CompactFrames.from_images(images, [self.delay] * len(images), size)
+    
+    def get_photo(self, state, index):
+        """PhotoImage for a frame, created on demand and kept in a size-bounded LRU"""
+        key = (state, index)
+        photo = self.photo_cache.get(key)
+        if photo is not None:
+            self.photo_cache.move_to_end(key)
+            return photo
+        photo = ImageTk.PhotoImage(self.preloaded_gifs[state].image(index))
+        self.photo_cache[key] = photo
+        while len(self.photo_cache) > OVERLAY_PHOTO_CACHE_FRAMES:
+            self.photo_cache.popitem(last=False)
+        return photo
+    
+    def memory_report(self):
+        """Bytes held per state: compact frame data plus the PhotoImages currently cached"""
+        photo_bytes = self.window_width * self.window_height * 4  # Tk keeps 32-bit pixels
+        report = {}
+        for state, frames in self.preloaded_gifs.items():
+            photos = sum(1 for cached_state, _ in self.photo_cache if cached_state == state)
+            report[state] = {
+                "frames": len(frames),
+                "compact_bytes": frames.nbytes,
+                "memory_mapped": isinstance(frames.indices, memoryview),
+                "photo_images": photos,
+                "photo_bytes": photos * photo_bytes,
+            }
+        for state, entry in report.items():
+            print(f"🧮 {state}: {entry['frames']} frames, {entry['compact_bytes']/1024:.0f} KB compact"
+                  f"{' (mmap)' if entry['memory_mapped'] else ''}, {entry['photo_images']} PhotoImages "
+                  f"({entry['photo_bytes']/1024:.0f} KB)")
+        return report
         
     def start_move(self, event):
         self.x = event.x
@@ -221,8 +590,12 @@ class GifOverlay:
         
         if state in self.preloaded_gifs:
             self.frames = self.preloaded_gifs[state]
+            self.durations = self.frame_durations[state]
+            self.keys = self.frame_keys[state]
             self.current_state = state
             self.current_frame = 0
+            self.next_frame_at = None
+            self.displayed_key = None
             if self.frames:
                 self.animate()
             else:
@@ -230,18 +603,114 @@ class GifOverlay:
         else:
             print(f"❌ Unknown state: {state}")
     
+    def is_visible(self):
+        try:
+            return bool(self.root.winfo_viewable()) and self.root.state() != "iconic"
+        except tk.TclError:
+            return False
+    
     def animate(self):
-        if self.frames:
-            try:
-                self.label.config(image=self.frames[self.current_frame])
-                self.current_frame = (self.current_frame + 1) % len(self.frames)
-                self.animation_id = self.root.after(self.delay, self.animate)
-            except Exception as e:
-                print(f"⚠️ Animation error: {e}")
+        """Show the frame due now; scheduled on the monotonic clock using each frame's own duration"""
+        self.animation_id = None
+        if not self.frames:
+            return
+        cpu_started = time.thread_time()
+        try:
+            if not self.is_visible():
+                # Hidden or minimized: don't draw, just check back occasionally
+                self.next_frame_at = None
+                self.animation_id = self.root.after(ANIMATION_HIDDEN_POLL_MS, self.animate)
+                return
+            
+            count = len(self.frames)
+            now = time.monotonic()
+            if self.next_frame_at is None or now - self.next_frame_at > sum(self.durations):
+                self.next_frame_at = now  # First frame, or so far behind that catching up is pointless
+            
+            # Drop frames whose display slot has already passed
+            while now >= self.next_frame_at + self.durations[self.current_frame]:
+                self.next_frame_at += self.durations[self.current_frame]
+                self.current_frame = (self.current_frame + 1) % count
+                self.animation_stats["dropped"] += 1
+            
+            key = self.keys[self.current_frame]
+            if key != self.displayed_key:
+                self.displayed_photo = self.get_photo(self.current_state, self.current_frame)
+                self.label.config(image=self.displayed_photo)
+                self.displayed_key = key
+                self.animation_stats["rendered"] += 1
+                if not self.first_frame_shown:
+                    self.first_frame_shown = True
+                    self.root.after_idle(lambda: print(
+                        f"🖼️ First frame on screen {(time.perf_counter() - PROCESS_STARTED)*1000:.0f} ms after launch"))
+                if self.state_requested_at is not None:
+                    # Idle callbacks queued after config run once Tk has redrawn the label
+                    self.root.after_idle(self.record_state_latency, self.current_state, self.state_requested_at)
+                    self.state_requested_at = None
+            else:
+                self.animation_stats["identical"] += 1
+            
+            # Merge following identical frames into one longer wait
+            self.next_frame_at += self.durations[self.current_frame]
+            self.current_frame = (self.current_frame + 1) % count
+            merged = 1
+            while merged < count and self.keys[self.current_frame] == key:
+                self.next_frame_at += self.durations[self.current_frame]
+                self.current_frame = (self.current_frame + 1) % count
+                self.animation_stats["identical"] += 1
+                merged += 1
+            if merged >= count:
+                return  # Every frame looks the same: nothing left to animate
+            
+            delay_ms = max(1, int((self.next_frame_at - time.monotonic()) * 1000))
+            self.animation_id = self.root.after(delay_ms, self.animate)
+        except Exception as e:
+            print(f"⚠️ Animation error: {e}")
+        finally:
+            self.animation_stats["cpu_time"] += time.thread_time() - cpu_started
+    
+    def record_state_latency(self, state, requested_at):
+        latency = time.monotonic() - requested_at
+        self.state_latencies.append(latency)
+        print(f"⏱️ {state} on screen {latency*1000:.0f} ms after request")
+    
+    def report_animation_stats(self):
+        stats = self.animation_stats
+        events = ui_events.stats
+        print(f"🎞️ Animation: {stats['rendered']} rendered, {stats['dropped']} dropped, "
+              f"{stats['identical']} identical skipped, {stats['cpu_time']*1000:.0f} ms CPU")
+        if self.state_latencies:
+            latencies = sorted(self.state_latencies)
+            print(f"   State switches: median {latencies[len(latencies) // 2]*1000:.0f} ms, "
+                  f"max {latencies[-1]*1000:.0f} ms to first frame; "
+                  f"{events['coalesced']}/{events['posted']} requests coalesced")
+        return dict(stats)
+    
+    def poll_ui_events(self):
+        """Tk thread: apply the latest state requested by other threads"""
+        for kind, value, posted_at in ui_events.drain():
+            if kind == "state":
+                self.change_state(value, requested_at=posted_at)
+            elif kind == "quit":
+                self.root.quit()
+                return
+        self.root.after(UI_EVENT_POLL_MS, self.poll_ui_events)
     
-    def change_state(self, state):
-        if state in self.preloaded_gifs and state != self.current_state:
+    def change_state(self, state, requested_at=None):
+        """Tk thread only; other threads go through set_gif_state"""
+        if state not in self.gif_paths():
+            print(f"❌ Unknown state: {state}")
+        elif state not in self.preloaded_gifs:
+            self.pending_state = state  # Switch as soon as its frames finish loading
+            self.state_requested_at = requested_at or time.monotonic()
+        elif state == self.current_state:
+            self.pending_state = None  # A newer request cancels one still waiting on its frames
+        else:
+            self.pending_state = None
+            self.state_requested_at = requested_at or time.monotonic()
             print(f"🔄 Changing state to: {state} (instant)")
+            self.report_animation_stats()
+            self.memory_report()
             self.load_preloaded_gif(state)
     
     def run(self):
@@ -252,301 +721,3077 @@ class GifOverlay:
 
 
 # -------------------------
-# Helpers
+# TTS Audio Cache
 # -------------------------
-def _hidden_startupinfo():
-    if platform.system() == "Windows":
-        si = subprocess.STARTUPINFO()
-        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        return si
-    return None
+class TTSCache:
+    """Content-addressed MP3 cache (memory + disk, both LRU) keyed by text and voice settings"""
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_disk_bytes=TTS_CACHE_MAX_BYTES,
+                 max_memory_bytes=TTS_CACHE_MEMORY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._scan_disk()
 
+    def _scan_disk(self):
+        """Rebuild the disk LRU from file mtimes (touched on every hit)"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".mp3"):
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self._evict()
 
-async def _edge_save(text: str, out_path: str):
-    comm = edge_tts.Communicate(text, voice=VOICE_NAME, rate=TTS_RATE, pitch=TTS_PITCH)
-    await comm.save(out_path)
+    @staticmethod
+    def key(text, voice=None, rate=None, pitch=None):
+        material = "\n".join([voice or VOICE_NAME, rate or TTS_RATE, pitch or TTS_PITCH, text.strip()])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
 
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key + ".mp3")
 
-def speak(text: str):
-    tmp_name = f"tts_{uuid.uuid4().hex}.mp3"
-    tmp_path = os.path.join(TEMP_DIR, tmp_name)
+    def get_path(self, text):
+        """Path of the cached MP3 for text, or None (counts a hit or a miss)"""
+        key = self.key(text)
+        with self.lock:
+            if key in self.disk:
+                self.disk.move_to_end(key)
+                self.hits += 1
+                path = self.path_for(key)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+            self.misses += 1
+            return None
 
-    for attempt in range(EDGE_TTS_RETRIES):
+    def peek_path(self, text):
+        """Path of the cached MP3 for text, or None, without counting a hit or a miss"""
+        key = self.key(text)
+        with self.lock:
+            return self.path_for(key) if key in self.disk else None
+
+    def get_bytes(self, text):
+        """Cached MP3 bytes for text, served from memory when possible (counts a hit or a miss)"""
+        key = self.key(text)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+            if key not in self.disk:
+                self.misses += 1
+                return None
+        path = self.get_path(text)
+        if path is None:
+            return None  # Evicted between the two lookups
         try:
-            asyncio.run(asyncio.wait_for(_edge_save(text, tmp_path), timeout=EDGE_TTS_TIMEOUT))
-            try:
-                playsound(tmp_path)
-            except:
-                print("⚠️ Playback failed, fallback to text:", text)
-            try:
-                os.remove(tmp_path)
-            except: pass
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self.lock:
+            self._remember(key, data)
+        return data
+
+    def put_bytes(self, text, data):
+        key = self.key(text)
+        path = self.path_for(key)
+        tmp_path = path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self._add_disk(key, len(data))
+            self._remember(key, data)
+        return path
+
+    def _add_disk(self, key, size):
+        self.disk_bytes += size - self.disk.pop(key, 0)
+        self.disk[key] = size
+        self._evict()
+
+    def _remember(self, key, data):
+        if len(data) > self.max_memory_bytes:
             return
-        except Exception as e:
-            print(f"⚠️ Edge-TTS attempt {attempt+1} failed:", repr(e))
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old)
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        while self.memory_bytes > self.max_memory_bytes and self.memory:
+            _, data = self.memory.popitem(last=False)
+            self.memory_bytes -= len(data)
+        while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self.memory_bytes -= len(self.memory.pop(key, b""))
             try:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-            except: pass
-            time.sleep(EDGE_TTS_BACKOFF * (2 ** attempt))
-    print("❌ Edge-TTS all attempts failed. Fallback:", text)
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
 
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": len(self.disk), "disk_bytes": self.disk_bytes,
+                    "memory_entries": len(self.memory), "memory_bytes": self.memory_bytes}
 
-def beep(freq=1000, duration_ms=200):
-    try:
-        if platform.system() == "Windows":
-            import winsound
-            winsound.Beep(int(freq), int(duration_ms))
+    def presynthesize(self, phrases, background=True):
+        """Synthesize any phrases not yet cached so they play instantly later"""
+        units = list(dict.fromkeys(unit for phrase in phrases for unit in split_sentences([phrase])))
+        missing = [p for p in units if not os.path.exists(self.path_for(self.key(p)))]
+        # Jobs run concurrently on the TTS runtime (bounded by TTS_MAX_CONCURRENCY). Not hedged:
+        # only edge-tts audio is cached, and nobody is waiting to hear these yet
+        streams = [SpeechStream(phrase, hedge=False, track=False) for phrase in missing]
+
+        def wait():
+            for stream in streams:
+                stream.done.wait()  # Set after the audio is stored, not subject to the playback deadline
+            with self.lock:
+                landed = sum(1 for phrase in missing if self.key(phrase) in self.disk)
+            if landed:
+                print(f"🗣️ Pre-synthesized {landed} phrase(s) into the TTS cache")
+            if landed < len(missing):
+                print(f"⚠️ {len(missing) - landed} phrase(s) could not be pre-synthesized")
+
+        if background:
+            threading.Thread(target=wait, daemon=True).start()
         else:
-            sys.stdout.write("\a"); sys.stdout.flush()
-    except: pass
+            wait()
 
 
-def record_audio(output_file="command.wav", record_seconds=3):
-    output_file = os.path.join(TEMP_DIR, output_file)
-    p = pyaudio.PyAudio()
-    stream = p.open(format=FORMAT, channels=CHANNELS,
-                    rate=SAMPLE_RATE, input=True, frames_per_buffer=CHUNK)
-    print("🎤 Recording... Speak your command!")
-    frames = [stream.read(CHUNK, exception_on_overflow=False) for _ in range(int(SAMPLE_RATE / CHUNK * record_seconds))]
-    print("✅ Done recording.")
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
-    
-    wf = wave.open(output_file, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(p.get_sample_size(FORMAT))
-    wf.setframerate(SAMPLE_RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()
-    return output_file
+tts_cache = TTSCache()
 
 
-def transcribe_audio(audio_file):
-    print("📝 Running Whisper.cpp...")
-    subprocess.run([WHISPER_PATH, "-m", MODEL_PATH, "-f", audio_file, "--output-txt", "--threads", str(os.cpu_count())],
-                   capture_output=True, text=True, check=False, startupinfo=_hidden_startupinfo(),
-                   creationflags=subprocess.CREATE_NO_WINDOW)
-    txt_file = audio_file + ".txt"
-    if os.path.exists(txt_file):
-        with open(txt_file, "r", encoding="utf-8", errors="ignore") as f:
-            transcription = f.read().strip()
-            print("📖 You said:", transcription)
-            # Clean up transcription file
-            try:
-                os.remove(txt_file)
-            except: pass
-            return transcription
-    return None
+# -------------------------
+# TTS Runtime (persistent asyncio loop)
+# -------------------------
+class TTSRuntime:
+    """Background event loop that runs every edge-tts job; submit from any thread, get a Future"""
 
+    def __init__(self, max_concurrency=TTS_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.thread = None
+        self.semaphore = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
 
-def ask_gemini(user_text):
-    history.append({"role": "user", "parts": [{"text": user_text}]})
-    if len(history) > MAX_MEMORY*2:
-        del history[0:2]
-    payload = {"contents": history}
-    headers = {"Content-Type": "application/json"}
-    try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
-        data = response.json()
-        reply = data["candidates"][0]["content"]["parts"][0]["text"]
-        history.append({"role": "model", "parts": [{"text": reply}]})
-        print("🤖 Gemini:", reply)
-        return reply
-    except Exception as e:
-        print("⚠️ Gemini error:", e)
-        return f"Error: {e}"
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.ready.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.ready.wait()
 
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.ready.set()
+        self.loop.run_forever()
 
-def listen_for_wake_word():
-    print("👂 Listening for wake word 'hey liebe'...")
-    try:
-        porcupine = pvporcupine.create(access_key=PORCUPINE_API_KEY, keyword_paths=[PORCUPINE_PPN])
-        pa = pyaudio.PyAudio()
-        audio_stream = pa.open(rate=porcupine.sample_rate, channels=1, format=pyaudio.paInt16,
-                               input=True, frames_per_buffer=porcupine.frame_length)
-        try:
-            while True:
-                pcm = audio_stream.read(porcupine.frame_length, exception_on_overflow=False)
-                pcm = [int.from_bytes(pcm[i:i+2], byteorder="little", signed=True) for i in range(0, len(pcm), 2)]
-                if porcupine.process(pcm) >= 0:
-                    print("✅ Wake word 'hi liebe' detected!")
-                    return True
-        finally:
-            audio_stream.stop_stream()
-            audio_stream.close()
-            porcupine.delete()
-    except Exception as e:
-        print(f"⚠️ Wake word listener error: {e}")
-        return False
+    def submit(self, coro):
+        """Schedule a coroutine on the runtime loop; returns a concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
+    def synthesize(self, text, on_chunk=None):
+        """Future resolving to the complete MP3 bytes; on_chunk(bytes) sees audio as it arrives"""
+        return self.submit(self._synthesize(text, on_chunk))
 
-def set_gif_state(state):
-    global gif_window
-    if gif_window:
-        gif_window.change_state(state)
+    async def _synthesize(self, text, on_chunk):
+        async with self.semaphore:
+            for attempt in range(EDGE_TTS_RETRIES):
+                parts = []
+                try:
+                    await asyncio.wait_for(self._stream(text, parts, on_chunk), timeout=EDGE_TTS_TIMEOUT)
+                    return b"".join(parts)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Edge-TTS attempt {attempt+1} failed:", repr(e))
+                    if parts or attempt + 1 >= EDGE_TTS_RETRIES:
+                        raise  # Audio already went out; retrying would repeat it
+                # Backoff without blocking the loop or any other synthesis job
+                await asyncio.sleep(EDGE_TTS_BACKOFF * (2 ** attempt))
 
+    @staticmethod
+    async def _stream(text, parts, on_chunk):
+        import edge_tts
+        comm = edge_tts.Communicate(text, voice=VOICE_NAME, rate=TTS_RATE, pitch=TTS_PITCH)
+        async for chunk in comm.stream():
+            if chunk["type"] == "audio" and chunk["data"]:
+                parts.append(chunk["data"])
+                if on_chunk:
+                    on_chunk(chunk["data"])
 
-def assistant_loop():
-    global gif_window
-    while True:
-        # Step 1: Always show idle.gif while waiting for wake word
-        set_gif_state("idle")
-        
-        # Wait for wake word detection
-        if listen_for_wake_word():
-            # Step 2: Show listening.gif during recording
-            set_gif_state("listening")
-            beep(800, 150)  # Start recording beep
-            
-            # Record audio
-            audio_file = record_audio()
-            
-            # Step 3: Keep showing listening.gif during transcription
-            text = transcribe_audio(audio_file)
-            
-            # Clean up audio file
-            try:
-                os.remove(audio_file)
-            except: pass
-            
-            if not text: 
-                print("❌ No transcription received, returning to idle state")
-                continue
-            
-            # Step 4: Show listening.gif while processing with Gemini
-            print("🤖 Processing with Gemini...")
-            combined_text = f"{CUSTOM_PROMPT}\n\nUser said: {text}\n\n{CONSTANT_TEXT}" if USE_CUSTOM_MESSAGE else f"{text}\n\n{CONSTANT_TEXT}"
-            reply = ask_gemini(combined_text)
-            
-            # Step 5: Show speaking.gif during TTS playback
-            set_gif_state("speaking")
-            beep(600, 150)  # Start speaking beep
-            speak(reply)
-            
-            print("✅ Conversation cycle completed, returning to idle state")
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
 
 
-def create_icon():
-    logo_path = os.path.join(ASSETS_DIR, "logo.ico")
-    if os.path.exists(logo_path):
-        return PILImage.open(logo_path)
-    return PILImage.new('RGB', (64, 64), (0, 0, 0))
+tts_runtime = TTSRuntime()
+atexit.register(tts_runtime.stop)
 
 
-def on_quit(icon, item):
-    print("👋 Assistant stopped.")
-    icon.stop()
-    if gif_window:
-        gif_window.root.quit()
-    sys.exit(0)
+class LocalTTS:
+    """Offline voice (pyttsx3: SAPI5, NSSpeechSynthesizer or eSpeak) rendering whole utterances on one thread"""
 
+    def __init__(self, rate=LOCAL_TTS_RATE):
+        self.rate = rate
+        self.engine = None
+        self.installed = None
+        self.broken = False
+        self.executor = None
+        self.lock = threading.Lock()
 
-def run_tray():
-    try:
-        icon = Icon("Assistant", create_icon(), menu=Menu(MenuItem("Quit", on_quit)))
-        icon.run()
-    except Exception as e:
-        print(f"⚠️ System tray error: {e}")
+    def available(self):
+        if self.installed is None:
+            self.installed = importlib.util.find_spec("pyttsx3") is not None
+        return self.installed and not self.broken
 
+    def _submit(self, fn, *args):
+        with self.lock:
+            if self.executor is None:
+                # pyttsx3 engines must stay on the thread that created them
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-tts")
+            return self.executor.submit(fn, *args)
 
-def run_gif_window():
-    global gif_window
-    try:
-        gif_window = GifOverlay()
-        gif_window.run()
-    except Exception as e:
-        print(f"❌ GIF window error: {e}")
+    def _engine(self):
+        if self.engine is None:
+            try:
+                if platform.system() == "Windows":
+                    import comtypes
+                    comtypes.CoInitialize()  # SAPI5 is COM; this worker thread needs its own apartment
+                import pyttsx3
+                self.engine = pyttsx3.init()
+                self.engine.setProperty("rate", self.rate)
+            except Exception:
+                self.broken = True
+                raise
+        return self.engine
+
+    def warm(self):
+        """Create the engine ahead of the first hedge; returns a Future"""
+        return self._submit(self._engine)
+
+    def synthesize(self, text, skip=None):
+        """Future resolving to the rendered audio file's bytes (None when skip() says it is no longer needed)"""
+        return self._submit(self._render, text, skip)
+
+    def _render(self, text, skip):
+        if skip is not None and skip():
+            return None  # The other engine won while this job was queued
+        engine = self._engine()
+        path = os.path.join(TEMP_DIR, f"local_tts_{threading.get_ident()}.wav")
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stop(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+local_tts = LocalTTS()
+atexit.register(local_tts.stop)
 
 
 # -------------------------
-# GIF Optimization Script
+# Speech Playback (streaming, in memory)
 # -------------------------
-def optimize_gif(input_path, output_path, target_size=(180, 320), fps=10):
-    """
-    Optimize GIF: reduce size, FPS, and colors
-    """
-    if not os.path.exists(input_path):
-        print(f"❌ Input file not found: {input_path}")
-        return False
-    
-    try:
-        with Image.open(input_path) as img:
-            frames = []
-            delay = int(1000 / fps)  # Convert FPS to delay in ms
-            
-            print(f"🔄 Optimizing {os.path.basename(input_path)}...")
-            print(f"   Target: {target_size[0]}x{target_size[1]}, {fps} FPS")
-            
-            frame_count = 0
-            for frame in ImageSequence.Iterator(img):
-                # Resize frame
-                frame_resized = frame.resize(target_size, Image.Resampling.LANCZOS)
-                
-                # Convert to palette mode (reduce colors)
-                if frame_resized.mode != 'P':
-                    frame_resized = frame_resized.convert('P', palette=Image.ADAPTIVE, colors=64)
-                
-                frames.append(frame_resized)
-                frame_count += 1
-            
-            # Save optimized GIF
-            frames[0].save(
-                output_path,
-                save_all=True,
-                append_images=frames[1:],
-                optimize=True,
-                duration=delay,
-                loop=0,
-                palette=Image.ADAPTIVE
-            )
-        
-        original_size = os.path.getsize(input_path) / 1024  # KB
-        new_size = os.path.getsize(output_path) / 1024  # KB
-        print(f"✅ Optimized: {os.path.basename(input_path)}")
-        print(f"   Frames: {frame_count}")
-        print(f"   Size: {original_size:.1f}KB → {new_size:.1f}KB ({((original_size-new_size)/original_size)*100:.1f}% reduction)")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error optimizing {input_path}: {e}")
-        return False
+class TTSHedgeStats:
+    """Which engine produced each utterance's first audio, how fast, and how often the local voice was needed"""
 
+    def __init__(self, window=TRACE_WINDOW):
+        self.lock = threading.Lock()
+        self.utterances = 0
+        self.hedged = 0
+        self.wins = {}
+        self.latencies = deque(maxlen=window)  # Seconds from synthesis request to first audio
 
-def optimize_all_gifs():
-    """Optimize all GIF files in the gifs directory"""
-    gif_files = {
-        "idle": os.path.join(GIFS_DIR, "idle.gif"),
-        "listening": os.path.join(GIFS_DIR, "listening.gif"), 
-        "speaking": os.path.join(GIFS_DIR, "speaking.gif")
-    }
-    
-    optimized_count = 0
-    for name, path in gif_files.items():
-        if os.path.exists(path):
-            output_path = path.replace('.gif', '_optimized.gif')
-            if optimize_gif(path, output_path, target_size=(180, 320), fps=10):
-                optimized_count += 1
+    def record(self, speech):
+        with self.lock:
+            self.utterances += 1
+            self.hedged += int(speech.hedged)
+            winner = speech.winner or "none"
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+            if speech.latency is not None:
+                self.latencies.append(speech.latency)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {"utterances": self.utterances, "hedged": self.hedged,
+                    "hedge_rate": self.hedged / self.utterances if self.utterances else 0.0,
+                    "wins": dict(self.wins),
+                    "p50_ms": _percentile(latencies, 50) * 1000 if latencies else None,
+                    "p95_ms": _percentile(latencies, 95) * 1000 if latencies else None}
+
+
+tts_hedge_stats = TTSHedgeStats()
+
+
+class SpeechStream:
+    """Audio chunks for one utterance, filled by the TTS runtime as edge-tts delivers them.
+
+    If edge-tts is still silent TTS_HEDGE_DELAY_MS after playback starts waiting, the local
+    voice renders the utterance too; whichever produces audio first wins and the other is cancelled.
+    """
+
+    def __init__(self, text, hedge=TTS_HEDGE_ENABLED, track=True):
+        self.text = text
+        self.chunks = queue.Queue()
+        self.failed = False
+        self.from_cache = False
+        self.future = None
+        self.local_future = None
+        self.audio_format = "mp3"  # None: let ffmpeg probe the container (the local voice writes WAV or AIFF)
+        self.winner = None         # "cache", "edge" or "local"
+        self.hedged = False
+        self.latency = None
+        self.created_at = time.monotonic()
+        self.can_hedge = hedge and local_tts.available()
+        self.pending = set()       # Engines that may still produce audio
+        self.track = track         # Count this utterance in tts_hedge_stats
+        self.ended = False
+        self.done = threading.Event()
+        self.lock = threading.RLock()  # Cancelling a pending future runs its done-callback right here
+        cached = tts_cache.get_bytes(text)
+        if cached is not None:
+            self.from_cache = True
+            self.winner, self.latency = "cache", 0.0
+            self.chunks.put(cached)
+            self._end()
         else:
-            print(f"⚠️ Original GIF not found: {path}")
-    
-    print(f"\n🎉 Optimization complete: {optimized_count}/3 GIFs optimized")
-    return optimized_count > 0
+            self.pending.add("edge")
+            self.future = tts_runtime.synthesize(text, on_chunk=self._edge_chunk)
+            self.future.add_done_callback(self._edge_finished)
 
+    def _win(self, engine):
+        """Called with the lock held when an engine has audio; False if another engine already won"""
+        if self.winner is None and not self.ended:
+            self.winner = engine
+            self.latency = time.monotonic() - self.created_at
+            if engine == "local":
+                self.audio_format = None
+                self.future.cancel()
+                print(f"🛟 Local voice won after {self.latency*1000:.0f} ms:", self.text)
+            elif self.local_future is not None:
+                self.local_future.cancel()
+        return self.winner == engine and not self.ended
 
-if __name__ == "__main__":
-    print("🚀 Starting Assistant...")
-    
-    # Check and optimize GIFs if needed
-    if not all(os.path.exists(gif) for gif in [IDLE_GIF, LISTENING_GIF, SPEAKING_GIF]):
-        print("🔧 Optimizing GIFs for better performance...")
-        optimize_all_gifs()
-    
-    # Check if required GIFs exist
-    for gif_path in [IDLE_GIF, LISTENING_GIF, SPEAKING_GIF]:
-        if not os.path.exists(gif_path):
-            print(f"⚠️ Warning: GIF not found - {gif_path}")
+    def _edge_chunk(self, chunk):
+        with self.lock:
+            if self._win("edge"):
+                self.chunks.put(chunk)
+
+    def _edge_finished(self, future):
+        with self.lock:
+            self.pending.discard("edge")
+            if future.cancelled():
+                if self.winner == "edge":
+                    self._end()
+                return
+            if future.exception() is not None:
+                if self.winner == "edge":
+                    self.failed = True
+                    print("❌ Edge-TTS failed mid-utterance. Fallback:", self.text)
+                    self._end()
+                elif self.winner is None:
+                    if self.can_hedge and not self.hedged:
+                        self._hedge()  # Nothing to wait for any more
+                    self._give_up_if_exhausted("❌ Edge-TTS all attempts failed. Fallback:")
+                return
+            if self.winner == "edge":
+                if future.result():
+                    tts_cache.put_bytes(self.text, future.result())
+                self._end()
+            elif self.winner is None:
+                self._give_up_if_exhausted("❌ Edge-TTS returned no audio. Fallback:")
+
+    def _hedge(self):
+        """Start the local voice (lock held)"""
+        self.hedged = True
+        self.pending.add("local")
+        print(f"⏳ No Edge-TTS audio after {(time.monotonic() - self.created_at)*1000:.0f} ms, starting local voice")
+        self.local_future = local_tts.synthesize(self.text, skip=lambda: self.winner is not None or self.ended)
+        self.local_future.add_done_callback(self._local_finished)
+
+    def _local_finished(self, future):
+        with self.lock:
+            self.pending.discard("local")
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                print("⚠️ Local voice failed:", repr(future.exception()))
+            elif future.result() and self._win("local"):
+                self.chunks.put(future.result())
+                self._end()
+                return
+            if self.winner is None:
+                self._give_up_if_exhausted("❌ No TTS engine produced audio. Fallback:")
+
+    def _give_up_if_exhausted(self, message):
+        if not self.pending and not self.ended:
+            self.failed = True
+            print(message, self.text)
+            self._end()
+
+    def _end(self):
+        """Close the stream once (lock held, or during construction)"""
+        if not self.ended:
+            self.ended = True
+            self.chunks.put(None)
+            self.done.set()
+            if self.track and self.winner != "cache" and (self.winner is not None or self.failed):
+                tts_hedge_stats.record(self)
+
+    def _deadline_passed(self):
+        with self.lock:
+            if self.winner is None and not self.ended:
+                self.failed = True
+                print(f"⌛ No audio within {TTS_DEADLINE_MS} ms. Fallback:", self.text)
+                self.future.cancel()
+                if self.local_future is not None:
+                    self.local_future.cancel()
+                self._end()
+
+    def __iter__(self):
+        # Hedge and deadline count from when playback starts waiting, so sentences
+        # synthesized ahead of time are not raced while earlier ones are still playing
+        waiting_since = time.monotonic()
+        hedge_at = max(self.created_at + TTS_HEDGE_DELAY_MS / 1000, waiting_since)
+        deadline = waiting_since + TTS_DEADLINE_MS / 1000
+        while True:
+            if self.winner is not None or self.ended:
+                chunk = self.chunks.get()
+            else:
+                now = time.monotonic()
+                wake_at = deadline if self.hedged or not self.can_hedge else min(hedge_at, deadline)
+                try:
+                    chunk = self.chunks.get(timeout=max(0.0, wake_at - now))
+                except queue.Empty:
+                    if time.monotonic() >= deadline:
+                        self._deadline_passed()
+                    else:
+                        with self.lock:
+                            if self.winner is None and not self.hedged and not self.ended:
+                                self._hedge()
+                    continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def cancel(self):
+        with self.lock:
+            if self.future is not None:
+                self.future.cancel()
+            if self.local_future is not None:
+                self.local_future.cancel()
+            self._end()
+
+
+class PlaybackHandle:
+    """Lets another thread stop playback and reports time-to-first-audio"""
+
+    def __init__(self, on_first_audio=None):
+        self.started_at = time.monotonic()
+        self.first_audio_at = None
+        self.on_first_audio = on_first_audio
+        self.stop_event = threading.Event()
+        self.finished = threading.Event()
+        self.playing = False
+        self.silenced = threading.Event()  # Set when playback actually went quiet after stop()
+
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    @property
+    def time_to_first_audio(self):
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.started_at
+
+    def mark_first_audio(self):
+        if self.first_audio_at is None:
+            self.first_audio_at = time.monotonic()
+            if self.on_first_audio:
+                self.on_first_audio()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+class StreamingPlayer:
+    """Decodes audio chunks incrementally (ffmpeg pipe) and writes PCM to a persistent output stream"""
+
+    def __init__(self, rate=TTS_OUTPUT_RATE):
+        self.rate = rate
+        self.pa = None
+        self.stream = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return bool(FFMPEG_PATH) and os.path.exists(FFMPEG_PATH)
+
+    def _output(self):
+        if self.stream is None:
+            import pyaudio
+            self.pa = pyaudio.PyAudio()
+            self.stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True)
+        return self.stream
+
+    def warm(self):
+        """Open the output device ahead of the first reply"""
+        with self.lock:
+            self._output()
+
+    def play(self, chunks, handle):
+        """Blocking; returns early when handle.stop() is called from another thread"""
+        stream = iter(chunks)
+        first = next(stream, None)  # The container is only known once an engine has produced audio
+        if first is None or handle.stopped:
+            if handle.stopped and hasattr(chunks, "cancel"):
+                chunks.cancel()
+            return
+        audio_format = getattr(chunks, "audio_format", "mp3")
+        decoder = subprocess.Popen(
+            [FFMPEG_PATH, "-hide_banner", "-loglevel", "error"] + (["-f", audio_format] if audio_format else [])
+            + ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(self.rate), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            startupinfo=_hidden_startupinfo(), creationflags=_hidden_creationflags())
+
+        def feed():
+            try:
+                decoder.stdin.write(first)
+                decoder.stdin.flush()
+                for chunk in stream:
+                    if handle.stopped:
+                        break
+                    decoder.stdin.write(chunk)
+                    decoder.stdin.flush()
+            except (BrokenPipeError, OSError):
+                pass
+            finally:
+                try:
+                    decoder.stdin.close()
+                except OSError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        leftover = b""
+        try:
+            with self.lock:
+                output = self._output()
+                handle.playing = True
+                while not handle.stopped:
+                    data = decoder.stdout.read1(PLAYBACK_BLOCK_BYTES)
+                    if not data:
+                        break
+                    data = leftover + data
+                    cut = len(data) - (len(data) % 2)
+                    data, leftover = data[:cut], data[cut:]
+                    if data:
+                        handle.mark_first_audio()
+                        output.write(data)
+        finally:
+            if handle.stopped:
+                self._discard_buffered()
+            handle.playing = False
+            if handle.stopped:
+                handle.silenced.set()
+            if decoder.poll() is None:
+                decoder.kill()
+            decoder.wait()
+            if handle.stopped and hasattr(chunks, "cancel"):
+                chunks.cancel()
+
+    def _discard_buffered(self):
+        """Drop audio already queued in the device (closing a PortAudio stream aborts it)"""
+        try:
+            if self.stream is not None:
+                self.stream.close()
+        except Exception:
+            pass
+        self.stream = None
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.stream is not None:
+                    self.stream.close()
+                if self.pa is not None:
+                    self.pa.terminate()
+            except Exception as e:
+                print(f"⚠️ Error closing audio output: {e}")
+            self.stream = None
+            self.pa = None
+
+
+player = StreamingPlayer()
+atexit.register(player.close)
+
+
+def _play_speech(speech, handle):
+    """Play a SpeechStream through the streaming player, or via playsound when ffmpeg is missing"""
+    if player.available():
+        try:
+            player.play(speech, handle)
+        except Exception as e:
+            print(f"⚠️ Streaming playback failed: {e}")
+    else:
+        audio = b"".join(speech)  # Wait for the complete utterance
+        if getattr(speech, "winner", None) == "local":
+            path = os.path.join(TEMP_DIR, "local_tts_playback.wav")
+            with open(path, "wb") as f:
+                f.write(audio)
+        else:
+            # The lookup that produced the audio already counted this text
+            path = None if speech.failed else tts_cache.peek_path(speech.text)
+        if path and not handle.stopped:
+            from playsound import playsound
+            handle.mark_first_audio()
+            handle.playing = True
+            try:
+                playsound(path)  # Blocking and not interruptible; stop() takes effect afterwards
+            except:
+                print("⚠️ Playback failed, fallback to text:", speech.text)
+            handle.playing = False
+            if handle.stopped:
+                handle.silenced.set()
+    if speech.failed and handle.first_audio_at is None:
+        print("💬", speech.text)
+
+
+# -------------------------
+# Helpers
+# -------------------------
+def _hidden_startupinfo():
+    if platform.system() == "Windows":
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        return si
+    return None
+
+
+def _hidden_creationflags():
+    return getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+_SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+
+
+def split_sentences(deltas, min_chars=12, openers=TTS_OPENERS):
+    """Regroup streamed text deltas into whole sentences as soon as each one is complete.
+
+    A leading opener (e.g. "Hey Babe,") becomes its own unit so its cached audio can play.
+    """
+    try:
+        yield from _split_sentences(deltas, min_chars, openers)
+    finally:
+        if hasattr(deltas, "close"):
+            deltas.close()  # Stop the upstream reply as soon as nobody wants more sentences
+
+
+def _split_sentences(deltas, min_chars, openers=()):
+    buffer = ""
+    opening = bool(openers)  # Still deciding whether the reply starts with an opener
+    for delta in deltas:
+        buffer += delta
+        if opening:
+            start = buffer.lstrip()
+            opener = next((o for o in openers if start.startswith(o)), None)
+            if opener is not None:
+                yield opener
+                buffer = start[len(opener):]
+                opening = False
+            elif any(o.startswith(start) for o in openers):
+                continue  # Too short to tell yet
+            else:
+                opening = False
+        while True:
+            match = None
+            for m in _SENTENCE_END.finditer(buffer):
+                if m.end() >= min_chars:
+                    match = m
+                    break
+            if match is None:
+                break
+            sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def beep(freq=1000, duration_ms=200):
+    try:
+        if platform.system() == "Windows":
+            import winsound
+            winsound.Beep(int(freq), int(duration_ms))
+        else:
+            sys.stdout.write("\a"); sys.stdout.flush()
+    except: pass
+
+
+def _frame_rms(pcm):
+    samples = array('h')
+    samples.frombytes(pcm)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(x * x for x in samples) / len(samples))
+
+
+class Recording:
+    """Captured command audio plus the speech boundaries measured while recording (seconds)"""
+
+    def __init__(self, pcm, duration, speech_start=None, speech_end=None, ended_by="fixed"):
+        self.pcm = pcm
+        self.duration = duration
+        self.speech_start = speech_start
+        self.speech_end = speech_end
+        self.ended_by = ended_by  # "fixed", "silence", "max_duration" or "no_speech"
+
+    @property
+    def has_speech(self):
+        return self.speech_start is not None
+
+    @property
+    def trailing_silence(self):
+        if self.speech_end is None:
+            return None
+        return self.duration - self.speech_end
+
+
+class VadEndpointer:
+    """Energy-based endpointer: waits for speech onset, stops after trailing silence"""
+
+    def __init__(self, chunk_samples=CHUNK, max_seconds=VAD_MAX_SECONDS,
+                 trailing_silence_ms=VAD_TRAILING_SILENCE_MS, onset_timeout=VAD_ONSET_TIMEOUT, onset_mask_ms=0):
+        self.chunk_ms = chunk_samples * 1000 / SAMPLE_RATE
+        # Pre-roll and the start beep: kept in the recording but cannot trigger speech onset
+        self.onset_mask_ms = onset_mask_ms
+        self.max_ms = max_seconds * 1000
+        self.trailing_silence_ms = trailing_silence_ms
+        self.onset_timeout_ms = onset_timeout * 1000
+        self.elapsed_ms = 0.0
+        self.noise_floor = None
+        self.speech_run_ms = 0.0
+        self.speech_start_ms = None
+        self.speech_end_ms = None
+        self.ended_by = None
+
+    def process(self, pcm):
+        """Feed one chunk; returns True once recording should stop"""
+        rms = _frame_rms(pcm)
+        masked = self.elapsed_ms < self.onset_mask_ms
+        if self.noise_floor is None and not masked:
+            # Seeded after the mask (the wake word tail is not room noise) and low enough that
+            # speech already under way when the mask lifts still clears VAD_ENERGY_THRESHOLD
+            self.noise_floor = min(rms, VAD_ENERGY_THRESHOLD / VAD_NOISE_MULTIPLIER)
+
+        if masked:
+            pass
+        elif rms >= max(VAD_ENERGY_THRESHOLD, self.noise_floor * VAD_NOISE_MULTIPLIER):
+            self.speech_run_ms += self.chunk_ms
+            if self.speech_start_ms is None and self.speech_run_ms >= VAD_MIN_SPEECH_MS:
+                self.speech_start_ms = self.elapsed_ms + self.chunk_ms - self.speech_run_ms
+            if self.speech_start_ms is not None:
+                self.speech_end_ms = self.elapsed_ms + self.chunk_ms
+        else:
+            self.speech_run_ms = 0.0
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        self.elapsed_ms += self.chunk_ms
+
+        if self.speech_start_ms is not None and self.elapsed_ms - self.speech_end_ms >= self.trailing_silence_ms:
+            self.ended_by = "silence"
+        elif self.speech_start_ms is None and self.elapsed_ms >= self.onset_timeout_ms + self.onset_mask_ms:
+            self.ended_by = "no_speech"
+        elif self.elapsed_ms >= self.max_ms:
+            self.ended_by = "max_duration"
+        return self.ended_by is not None
+
+    def trim_start(self):
+        """Byte offset the recording will start at (VAD_PADDING_MS before speech), or None before onset"""
+        if self.speech_start_ms is None:
+            return None
+        start_ms = self.speech_start_ms - VAD_PADDING_MS
+        if self.speech_start_ms <= self.onset_mask_ms + self.chunk_ms:
+            start_ms = 0  # Speech was already under way when the mask lifted
+        return max(0, int(start_ms * SAMPLE_RATE * 2 / 1000)) & ~1
+
+    def build_recording(self, pcm):
+        """Trim leading/trailing silence (keeping VAD_PADDING_MS) and attach the boundaries"""
+        duration = self.elapsed_ms / 1000
+        if self.speech_start_ms is None:
+            return Recording(b"", duration, ended_by=self.ended_by or "no_speech")
+        bytes_per_ms = SAMPLE_RATE * 2 / 1000
+        start = self.trim_start()
+        end = min(len(pcm), int((self.speech_end_ms + VAD_PADDING_MS) * bytes_per_ms)) & ~1
+        return Recording(pcm[start:end], duration, self.speech_start_ms / 1000,
+                         self.speech_end_ms / 1000, self.ended_by or "max_duration")
+
+
+def record_audio(record_seconds=None, vad=VAD_ENABLED, start_pos=None, mic=None, on_audio=None):
+    """Record a command from the shared mic stream; with vad=True record_seconds is only the upper bound.
+
+    start_pos is a ring buffer position (e.g. the wake word detection point); MIC_PREROLL_MS
+    before it is included so words spoken straight after the wake word are kept.
+    on_audio(chunk, speech_start) sees every chunk as it is captured (e.g. StreamingTranscriber.feed);
+    speech_start is the byte offset the trimmed recording will start at (None before speech onset).
+    """
+    mic = mic or mic_stream
+    mic.ensure_started()
+    if start_pos is not None:
+        start_pos -= int(MIC_PREROLL_MS * SAMPLE_RATE / 1000) * 2
+    reader = mic.reader(start_pos)
+    backlog_ms = reader.available() * 1000 / (SAMPLE_RATE * 2)
+    print("🎤 Recording... Speak your command!")
+    frames = []
+    if vad:
+        endpointer = VadEndpointer(max_seconds=record_seconds or VAD_MAX_SECONDS, onset_mask_ms=backlog_ms)
+        while True:
+            chunk = reader.read(CHUNK, timeout=MIC_READ_TIMEOUT)
+            if chunk is None:
+                print("⚠️ Microphone stalled, stopping recording")
+                endpointer.ended_by = endpointer.ended_by or "max_duration"
+                break
+            frames.append(chunk)
+            finished = endpointer.process(chunk)
+            if on_audio:
+                on_audio(chunk, endpointer.trim_start())
+            if finished:
+                break
+    else:
+        record_seconds = record_seconds or 3
+        for _ in range(int(SAMPLE_RATE / CHUNK * record_seconds)):
+            chunk = reader.read(CHUNK, timeout=MIC_READ_TIMEOUT)
+            if chunk is None:
+                break
+            frames.append(chunk)
+            if on_audio:
+                on_audio(chunk, 0)
+
+    if not vad:
+        print("✅ Done recording.")
+        return Recording(b''.join(frames), record_seconds)
+    recording = endpointer.build_recording(b''.join(frames))
+    if recording.has_speech:
+        print(f"✅ Done recording: speech {recording.speech_start:.2f}s → {recording.speech_end:.2f}s, "
+              f"stopped after {recording.trailing_silence:.2f}s silence ({recording.ended_by}, {recording.duration:.2f}s total)")
+    else:
+        print(f"✅ Done recording: no speech detected in {recording.duration:.2f}s")
+    return recording
+
+
+def pcm_to_wav_bytes(pcm):
+    """Wrap raw PCM in an in-memory WAV container for Whisper"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _audio_to_wav_bytes(audio):
+    """Accept a Recording, raw PCM bytes, or a path to an existing WAV file"""
+    if isinstance(audio, Recording):
+        audio = audio.pcm
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            return f.read()
+    return pcm_to_wav_bytes(audio)
+
+
+# -------------------------
+# Shared Microphone Stream
+# -------------------------
+class AudioRingBuffer:
+    """Single-producer ring buffer of PCM bytes.
+
+    The writer never takes a lock on the data path: it copies into the buffer and then
+    publishes the new total via write_pos. Readers keep their own absolute positions, so
+    any number of them can follow the same stream; the condition is only used for wakeups.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity - (capacity % 2)
+        self.buffer = bytearray(self.capacity)
+        self.write_pos = 0
+        self.data_ready = threading.Condition()
+
+    def write(self, data):
+        n = len(data)
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+        offset = self.write_pos % self.capacity
+        first = min(n, self.capacity - offset)
+        self.buffer[offset:offset + first] = data[:first]
+        if first < n:
+            self.buffer[0:n - first] = data[first:]
+        self.write_pos += n
+        with self.data_ready:
+            self.data_ready.notify_all()
+
+    def oldest_pos(self):
+        return max(0, self.write_pos - self.capacity)
+
+    def read(self, pos, n, timeout=None):
+        """Return (data, new_pos) for n bytes starting at pos, or (None, pos) on timeout"""
+        if self.write_pos < pos + n:
+            with self.data_ready:
+                if not self.data_ready.wait_for(lambda: self.write_pos >= pos + n, timeout):
+                    return None, pos
+        if pos < self.oldest_pos():
+            pos = self.oldest_pos()  # Reader fell behind by more than the buffer; skip ahead
+        offset = pos % self.capacity
+        first = min(n, self.capacity - offset)
+        data = bytes(self.buffer[offset:offset + first])
+        if first < n:
+            data += bytes(self.buffer[0:n - first])
+        return data, pos + n
+
+
+class MicReader:
+    """Independent cursor into the shared mic ring buffer"""
+
+    def __init__(self, ring, pos):
+        self.ring = ring
+        self.pos = max(pos, ring.oldest_pos())
+
+    def available(self):
+        return self.ring.write_pos - self.pos
+
+    def read(self, samples, timeout=None):
+        data, self.pos = self.ring.read(self.pos, samples * 2, timeout)
+        return data
+
+
+class MicStream:
+    """One always-open capture stream feeding AudioRingBuffer for every consumer"""
+
+    def __init__(self, rate=SAMPLE_RATE, chunk=CHUNK, buffer_seconds=MIC_BUFFER_SECONDS):
+        self.rate = rate
+        self.chunk = chunk
+        self.ring = AudioRingBuffer(int(rate * 2 * buffer_seconds))
+        self.pa = None
+        self.stream = None
+        self.continue_flag = 0  # pyaudio.paContinue, filled in once pyaudio is imported
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        """Open the device once; reopen only if the stream has died"""
+        with self.lock:
+            if self.stream is not None and self.stream.is_active():
+                return
+            self._close()
+            import pyaudio
+            self.continue_flag = pyaudio.paContinue
+            self.pa = pyaudio.PyAudio()
+            self.stream = self.pa.open(format=pyaudio.paInt16, channels=CHANNELS, rate=self.rate, input=True,
+                                       frames_per_buffer=self.chunk, stream_callback=self._on_audio)
+            self.stream.start_stream()
+            print("🎙️ Microphone stream opened")
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        self.ring.write(in_data)
+        return (None, self.continue_flag)
+
+    def position(self):
+        return self.ring.write_pos
+
+    def reader(self, start_pos=None):
+        """Reader starting at start_pos (defaults to now)"""
+        return MicReader(self.ring, self.ring.write_pos if start_pos is None else start_pos)
+
+    def stop(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        try:
+            if self.stream is not None:
+                self.stream.stop_stream()
+                self.stream.close()
+            if self.pa is not None:
+                self.pa.terminate()
+        except Exception as e:
+            print(f"⚠️ Error closing microphone: {e}")
+        self.stream = None
+        self.pa = None
+
+
+mic_stream = MicStream()
+atexit.register(mic_stream.stop)
+
+
+# -------------------------
+# Resident Whisper Server
+# -------------------------
+class WhisperServer:
+    """Long-lived whisper.cpp server process that keeps the model in memory"""
+
+    def __init__(self, exe_path=WHISPER_SERVER_PATH, model_path=MODEL_PATH,
+                 host=WHISPER_SERVER_HOST, port=WHISPER_SERVER_PORT, threads=None):
+        self.exe_path = exe_path
+        self.model_path = model_path
+        self.host = host
+        self.port = port
+        self.threads = threads or os.cpu_count()
+        self.process = None
+        self.restarts = 0
+        self.healthy_since = None
+        self.lock = threading.Lock()
+        self.monitor_thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def is_available(self):
+        return os.path.exists(self.exe_path) and os.path.exists(self.model_path)
+
+    def is_healthy(self):
+        """Process is alive and the HTTP endpoint answers (503 means still loading)"""
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            response = requests.get(f"{self.url}/health", timeout=1)
+            # Older whisper-server builds have no /health route; any answer means it is up
+            return response.status_code < 500
+        except requests.RequestException:
+            return False
+
+    def start(self):
+        """Spawn the server and block until the model is loaded"""
+        self._kill()
+        print(f"🧠 Starting resident Whisper server on {self.url}...")
+        self.process = subprocess.Popen(
+            [self.exe_path, "-m", self.model_path, "--host", self.host, "--port", str(self.port),
+             "--threads", str(self.threads)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            startupinfo=_hidden_startupinfo(), creationflags=_hidden_creationflags())
+        deadline = time.monotonic() + WHISPER_SERVER_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Whisper server exited with code {self.process.returncode}")
+            if self.is_healthy():
+                print("✅ Whisper server ready (model loaded)")
+                self.healthy_since = time.monotonic()
+                return
+            time.sleep(0.1)
+        self._kill()
+        raise TimeoutError(f"Whisper server not ready after {WHISPER_SERVER_STARTUP_TIMEOUT}s")
+
+    def ensure_running(self):
+        """Restart the server if it died; returns False once the restart budget is spent"""
+        with self.lock:
+            if self.is_healthy():
+                now = time.monotonic()
+                if self.healthy_since is None:
+                    self.healthy_since = now
+                elif self.restarts and now - self.healthy_since >= WHISPER_SERVER_RESTART_RESET:
+                    self.restarts = 0  # Only crashes close together should exhaust the budget
+                return True
+            self.healthy_since = None
+            if self.restarts >= WHISPER_SERVER_MAX_RESTARTS:
+                return False
+            if self.process is not None:
+                self.restarts += 1
+                print(f"⚠️ Whisper server unhealthy, restarting ({self.restarts}/{WHISPER_SERVER_MAX_RESTARTS})...")
+            try:
+                self.start()
+                return True
+            except Exception as e:
+                print(f"⚠️ Whisper server failed to start: {e}")
+                self.restarts += 1
+                return False
+
+    def start_monitor(self):
+        """Start the server and keep health-checking it in the background"""
+        if self.monitor_thread is not None or not self.is_available():
+            return
+        self.stopped.clear()
+        self.monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self.monitor_thread.start()
+
+    def _monitor(self):
+        while not self.stopped.is_set():
+            if not self.ensure_running() and self.restarts >= WHISPER_SERVER_MAX_RESTARTS:
+                print("❌ Whisper server keeps failing, falling back to whisper-cli")
+                return
+            self.stopped.wait(WHISPER_SERVER_HEALTH_INTERVAL)
+
+    def transcribe(self, wav_bytes):
+        response = requests.post(
+            f"{self.url}/inference",
+            files={"file": ("command.wav", wav_bytes, "audio/wav")},
+            data={"temperature": "0.0", "response_format": "json"},
+            timeout=WHISPER_SERVER_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json().get("text", "").strip()
+
+    def transcribe_segments(self, wav_bytes):
+        """[(start_seconds, end_seconds, text)] for each segment Whisper produced"""
+        response = requests.post(
+            f"{self.url}/inference",
+            files={"file": ("batch.wav", wav_bytes, "audio/wav")},
+            data={"temperature": "0.0", "response_format": "verbose_json"},
+            timeout=WHISPER_SERVER_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return [(float(seg["start"]), float(seg["end"]), seg["text"].strip())
+                for seg in response.json().get("segments", [])]
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            self._kill()
+
+    def _kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+whisper_server = WhisperServer()
+atexit.register(whisper_server.stop)
+
+
+def transcribe_audio(audio):
+    """Transcribe raw PCM bytes (or a WAV file path); audio and text never touch the disk"""
+    wav_bytes = _audio_to_wav_bytes(audio)
+    if whisper_server.is_available() and whisper_server.ensure_running():
+        print("📝 Transcribing with resident Whisper server...")
+        try:
+            transcription = whisper_server.transcribe(wav_bytes)
+            print("📖 You said:", transcription)
+            return transcription or None
+        except Exception as e:
+            print(f"⚠️ Whisper server error, falling back to whisper-cli: {e}")
+    return _transcribe_with_cli(wav_bytes)
+
+
+def _transcribe_with_cli(wav_bytes, threads=None):
+    print("📝 Running Whisper.cpp...")
+    # "-f -" reads the WAV from stdin; -nt/-np leave only the transcript on stdout
+    result = subprocess.run([WHISPER_PATH, "-m", MODEL_PATH, "-f", "-", "-nt", "-np",
+                             "--threads", str(threads or os.cpu_count())],
+                            input=wav_bytes, capture_output=True, check=False, startupinfo=_hidden_startupinfo(),
+                            creationflags=_hidden_creationflags())
+    transcription = result.stdout.decode("utf-8", errors="ignore").strip()
+    if transcription:
+        print("📖 You said:", transcription)
+        return transcription
+    return None
+
+
+# -------------------------
+# Streaming Transcription
+# -------------------------
+_NON_SPEECH = re.compile(r"\[[^\]]*\]|\([^)]*\)")  # [BLANK_AUDIO], (music) and similar markers
+
+
+def _word_key(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _server_segments(wav_bytes):
+    if not (whisper_server.is_available() and whisper_server.is_healthy()):
+        raise RuntimeError("whisper-server is not running")
+    return whisper_server.transcribe_segments(wav_bytes)
+
+
+class StreamingTranscriber:
+    """Decodes a command while it is still being spoken.
+
+    A background thread re-decodes the captured audio every STREAMING_STT_INTERVAL_MS. Words
+    on which two consecutive hypotheses agree become the stable partial (local agreement);
+    once committed segments make the window longer than STREAMING_STT_WINDOW_SECONDS they
+    slide out of it. If a hypothesis already covered the end of speech and matched the one
+    before it, finish() returns it without another decode.
+    """
+
+    def __init__(self, on_partial=None, decode_segments=None):
+        self.on_partial = on_partial  # on_partial(stable_text, hypothesis_text)
+        self.decode_segments = decode_segments or _server_segments
+        self.bytes_per_second = SAMPLE_RATE * 2
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.speech_start = None     # Byte offset the trimmed recording starts at, once speech began
+        self.window_start = 0        # Byte offset of the decode window in buffer
+        self.frozen = []             # Committed words that have left the window
+        self.hypothesis = []         # Latest decode of the window: [(word, segment_index)]
+        self.segments = []
+        self.stable_count = 0        # Leading words of hypothesis both of the last two decodes agree on
+        self.agreed = False          # Last two hypotheses were identical
+        self.decoded_until = 0.0     # Seconds of audio the latest hypothesis covers
+        self.decodes = 0
+        self.final_decode = None     # Whether finish() needed one more decode
+        self.failed = False
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="streaming-stt", daemon=True)
+        self.thread.start()
+
+    def feed(self, pcm, speech_start=0):
+        """Recorder thread: append newly captured audio.
+
+        speech_start is where the endpointer will trim the recording (None before speech).
+        The window starts there, so the pre-roll, the beep and leading silence, which the
+        non-streaming path trims away, are never sent to whisper.
+        """
+        with self.lock:
+            self.buffer += pcm
+            if self.speech_start is None and speech_start is not None:
+                self.speech_start = self.window_start = speech_start
+
+    @property
+    def stable_text(self):
+        return " ".join(self.frozen + [word for word, _ in self.hypothesis[:self.stable_count]])
+
+    def _run(self):
+        interval = STREAMING_STT_INTERVAL_MS / 1000
+        decoded_bytes = 0
+        while not self.done.wait(interval / 2):
+            with self.lock:
+                size = len(self.buffer)
+                window_start = self.window_start
+            if self.speech_start is None or size - window_start < STREAMING_STT_MIN_SECONDS * self.bytes_per_second \
+                    or size - decoded_bytes < interval * self.bytes_per_second:
+                continue
+            try:
+                self._decode(size)
+            except Exception as e:
+                print(f"⚠️ Streaming transcription stopped: {e}")
+                self.failed = True
+                return
+            decoded_bytes = size
+
+    def _decode(self, size):
+        with self.lock:
+            window = bytes(self.buffer[self.window_start:size])
+        segments = [(start, end, _NON_SPEECH.sub("", text).strip())
+                    for start, end, text in self.decode_segments(pcm_to_wav_bytes(window))]
+        words = [(word, index) for index, (_, _, text) in enumerate(segments) for word in text.split()]
+        previous = [_word_key(word) for word, _ in self.hypothesis]
+        current = [_word_key(word) for word, _ in words]
+        agreed = 0
+        while agreed < min(len(previous), len(current)) and previous[agreed] == current[agreed]:
+            agreed += 1
+        self.agreed = bool(current) and previous == current
+        self.stable_count = max(agreed, min(self.stable_count, len(words)))
+        self.hypothesis, self.segments = words, segments
+        self.decoded_until = size / self.bytes_per_second
+        self.decodes += 1
+        self._slide_window(len(window) / self.bytes_per_second)
+        if self.on_partial:
+            self.on_partial(self.stable_text, " ".join(self.frozen + [word for word, _ in self.hypothesis]))
+
+    def _slide_window(self, window_seconds):
+        """Freeze whole committed segments once the window grows past STREAMING_STT_WINDOW_SECONDS"""
+        if window_seconds <= STREAMING_STT_WINDOW_SECONDS or not self.stable_count:
+            return
+        last_stable_segment = self.hypothesis[self.stable_count - 1][1]
+        if self.stable_count < len(self.hypothesis) and self.hypothesis[self.stable_count][1] == last_stable_segment:
+            last_stable_segment -= 1  # That segment is only partly committed
+        if last_stable_segment < 0:
+            return
+        cut = sum(1 for _, index in self.hypothesis if index <= last_stable_segment)
+        self.frozen += [word for word, _ in self.hypothesis[:cut]]
+        self.hypothesis = [(word, index - last_stable_segment - 1) for word, index in self.hypothesis[cut:]]
+        self.stable_count -= cut
+        with self.lock:
+            self.window_start += int(self.segments[last_stable_segment][1] * self.bytes_per_second) & ~1
+        self.segments = self.segments[last_stable_segment + 1:]
+
+    def finish(self, recording):
+        """Final transcript once recording has ended, or None when streaming could not decode"""
+        self.done.set()
+        self.thread.join()
+        if self.failed or recording.speech_end is None or self.speech_start is None:
+            return None
+        covered = self.decoded_until >= recording.speech_end + STREAMING_STT_TAIL_MS / 1000
+        if not (covered and self.agreed):
+            try:
+                with self.lock:
+                    size = min(len(self.buffer), int((recording.speech_end + VAD_PADDING_MS / 1000) * self.bytes_per_second) & ~1)
+                self._decode(max(size, self.window_start))
+            except Exception as e:
+                print(f"⚠️ Streaming transcription final decode failed: {e}")
+                return None
+        self.final_decode = not (covered and self.agreed)
+        text = " ".join(self.frozen + [word for word, _ in self.hypothesis])
+        print("📖 You said:", text)
+        return text or None
+
+    def cancel(self):
+        self.done.set()
+
+
+# -------------------------
+# Batch Transcription
+# -------------------------
+_CLI_SEGMENT = re.compile(r"^\[(\d+):(\d+):(\d+\.\d+) --> (\d+):(\d+):(\d+\.\d+)\]\s*(.*)$")
+
+
+def _cli_segments(wav_bytes, threads):
+    """Segments from whisper-cli's timestamped stdout ("[00:00:01.000 --> 00:00:02.500]  text")"""
+    result = subprocess.run([WHISPER_PATH, "-m", MODEL_PATH, "-f", "-", "-np", "--threads", str(threads)],
+                            input=wav_bytes, capture_output=True, check=False, startupinfo=_hidden_startupinfo(),
+                            creationflags=_hidden_creationflags())
+    if result.returncode != 0:
+        raise RuntimeError(f"whisper-cli exited with code {result.returncode}")
+    segments = []
+    for line in result.stdout.decode("utf-8", errors="ignore").splitlines():
+        match = _CLI_SEGMENT.match(line.strip())
+        if match:
+            h1, m1, s1, h2, m2, s2, text = match.groups()
+            segments.append((int(h1) * 3600 + int(m1) * 60 + float(s1),
+                             int(h2) * 3600 + int(m2) * 60 + float(s2), text.strip()))
+    return segments
+
+
+def _audio_to_pcm(audio):
+    """Raw 16 kHz mono 16-bit PCM from a Recording, PCM bytes, or a path to a WAV file"""
+    if isinstance(audio, Recording):
+        return audio.pcm
+    if isinstance(audio, str):
+        with wave.open(audio, "rb") as wf:
+            _check_wav_format(audio, wf)
+            return wf.readframes(wf.getnframes())
+    return bytes(audio)
+
+
+def _check_wav_format(path, wf):
+    if (wf.getnchannels(), wf.getsampwidth(), wf.getframerate()) != (CHANNELS, 2, SAMPLE_RATE):
+        raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz mono 16-bit WAV")
+
+
+class _Clip:
+    """A queued clip; a WAV file only has its header read here, the samples are read by the decoder"""
+
+    def __init__(self, audio, future):
+        self.future = future
+        if isinstance(audio, str):
+            self.path, self.pcm = audio, None
+            with wave.open(audio, "rb") as wf:
+                _check_wav_format(audio, wf)
+                self.seconds = wf.getnframes() / SAMPLE_RATE
+        else:
+            self.path, self.pcm = None, _audio_to_pcm(audio)
+            self.seconds = len(self.pcm) / (SAMPLE_RATE * 2)
+
+    def read(self):
+        return self.pcm if self.path is None else _audio_to_pcm(self.path)
+
+
+class TranscriptionScheduler:
+    """Transcribes many clips on a fixed number of decoders that share the CPU cores between them.
+
+    Each decoder is its own whisper-server (or whisper-cli when the server is missing) with
+    cpu_count // decoders threads, so parallel decodes don't oversubscribe the machine.
+    Short clips are joined with a gap of silence and decoded together; segment timestamps
+    map the text back to each clip. Whisper may still run one segment across a gap, so
+    clips touched by such a segment are decoded again on their own. submit() returns a
+    Future, map() yields results in order. At most max_pending clips wait in the queue;
+    submit() blocks beyond that, so a large backlog never builds up in memory.
+    """
+
+    def __init__(self, decoders=TRANSCRIBE_DECODERS, short_clip_seconds=TRANSCRIBE_SHORT_CLIP_SECONDS,
+                 batch_seconds=TRANSCRIBE_BATCH_SECONDS, base_port=TRANSCRIBE_BASE_PORT,
+                 max_pending=TRANSCRIBE_MAX_PENDING):
+        if decoders < 1:
+            raise ValueError("TranscriptionScheduler needs at least one decoder")
+        self.threads_per_decoder = max(1, (os.cpu_count() or 1) // decoders)
+        self.short_clip_seconds = short_clip_seconds
+        self.batch_seconds = batch_seconds
+        self.gap = bytes(int(TRANSCRIBE_BATCH_GAP_MS * SAMPLE_RATE / 1000) * 2)
+        self.pending = deque()
+        self.slots = threading.Semaphore(max_pending)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.servers = []
+        self.counters = {"clips": 0, "batches": 0, "redecoded": 0, "audio_seconds": 0.0, "failed": 0}
+        self.first_started = None
+        self.last_finished = None
+        self.workers = []
+        for index in range(decoders):
+            server = None
+            if os.path.exists(WHISPER_SERVER_PATH) and os.path.exists(MODEL_PATH):
+                server = WhisperServer(port=base_port + index, threads=self.threads_per_decoder)
+                self.servers.append(server)
+            worker = threading.Thread(target=self._worker, args=(server,), name=f"transcriber-{index}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, audio):
+        """Queue one clip (Recording, PCM bytes or WAV path); the Future resolves to its text"""
+        future = Future()
+        clip = _Clip(audio, future)
+        self.slots.acquire()  # Outside the lock, so decoders can keep taking clips while we wait
+        with self.cond:
+            if self.closed:
+                self.slots.release()
+                raise RuntimeError("TranscriptionScheduler is closed")
+            self.pending.append(clip)
+            self.cond.notify()
+        return future
+
+    def map(self, clips):
+        """Transcripts for clips in input order (decoding runs ahead in parallel)"""
+        futures = [self.submit(clip) for clip in clips]
+        for future in futures:
+            yield future.result()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for worker in self.workers:
+            worker.join()
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self.cond:
+            stats = dict(self.counters)
+            wall = (self.last_finished - self.first_started) if self.last_finished else 0.0
+        stats["wall_seconds"] = wall
+        stats["audio_seconds_per_second"] = stats["audio_seconds"] / wall if wall else 0.0
+        stats["decoders"] = len(self.workers)
+        stats["threads_per_decoder"] = self.threads_per_decoder
+        return stats
+
+    def _next_batch(self):
+        """Block for the next clip; greedily add queued short clips up to batch_seconds"""
+        with self.cond:
+            while not self.pending and not self.closed:
+                self.cond.wait()
+            if not self.pending:
+                return None
+            batch = [self.pending.popleft()]
+            total = batch[0].seconds
+            gap_seconds = TRANSCRIBE_BATCH_GAP_MS / 1000
+            if total < self.short_clip_seconds:
+                while self.pending and self.pending[0].seconds < self.short_clip_seconds \
+                        and total + gap_seconds + self.pending[0].seconds <= self.batch_seconds:
+                    clip = self.pending.popleft()
+                    batch.append(clip)
+                    total += gap_seconds + clip.seconds
+            for _ in batch:
+                self.slots.release()
+            if self.first_started is None:
+                self.first_started = time.monotonic()
+            return batch
+
+    def _worker(self, server):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [clip for clip in batch if clip.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            redecoded = 0
+            try:
+                texts, redecoded = self._decode(server, batch)
+                for clip, text in zip(batch, texts):
+                    clip.future.set_result(text)
+                failed = 0
+            except Exception as e:
+                for clip in batch:
+                    clip.future.set_exception(e)
+                failed = len(batch)
+            with self.cond:
+                self.counters["clips"] += len(batch)
+                self.counters["batches"] += 1 + redecoded
+                self.counters["redecoded"] += redecoded
+                self.counters["audio_seconds"] += sum(clip.seconds for clip in batch)
+                self.counters["failed"] += failed
+                self.last_finished = time.monotonic()
+
+    def _segments(self, server, pcm):
+        wav_bytes = pcm_to_wav_bytes(pcm)
+        if server is not None and server.ensure_running():
+            return server.transcribe_segments(wav_bytes)
+        return _cli_segments(wav_bytes, self.threads_per_decoder)
+
+    def _decode(self, server, batch):
+        """One decode for the whole batch; returns (texts, clips decoded again on their own).
+
+        Each segment goes to the one clip it overlaps. Clips sharing a segment that spans a
+        gap are re-decoded alone, so text never leaks from one clip into another.
+        """
+        samples = [clip.read() for clip in batch]
+        pcm, bounds, offset = [], [], 0.0
+        for clip, clip_pcm in zip(batch, samples):
+            if pcm:
+                pcm.append(self.gap)
+                offset += len(self.gap) / (SAMPLE_RATE * 2)
+            pcm.append(clip_pcm)
+            bounds.append((offset, offset + clip.seconds))
+            offset += clip.seconds
+        segments = self._segments(server, b"".join(pcm))
+        tolerance = TRANSCRIBE_STRADDLE_MS / 1000
+        texts = [[] for _ in batch]
+        straddled = set()
+        for start, end, text in segments:
+            if not text:
+                continue
+            touched = [i for i, (clip_start, clip_end) in enumerate(bounds)
+                       if min(end, clip_end) - max(start, clip_start) > tolerance]
+            if len(touched) > 1:
+                straddled.update(touched)
+                continue
+            if not touched:  # Only silence or a sliver of speech: fall back to the midpoint
+                middle = (start + end) / 2
+                touched = [next((i for i, (_, clip_end) in enumerate(bounds) if middle <= clip_end), len(batch) - 1)]
+            texts[touched[0]].append(text)
+        for index in sorted(straddled):
+            texts[index] = [text for _, _, text in self._segments(server, samples[index]) if text]
+        return [" ".join(parts) for parts in texts], len(straddled)
+
+
+def transcribe_files(paths, decoders=TRANSCRIBE_DECODERS):
+    """CLI: transcribe WAV files (or directories of them) and print a throughput summary"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".wav")))
+        else:
+            files.append(path)
+    print(f"📝 Transcribing {len(files)} clip(s) on {decoders} decoder(s)...")
+    with TranscriptionScheduler(decoders=decoders) as scheduler:
+        futures = []
+        for path in files:
+            try:
+                futures.append((path, scheduler.submit(path)))
+            except (OSError, ValueError, wave.Error) as e:
+                print(f"⚠️ Skipping {path}: {e}")
+        for path, future in futures:
+            try:
+                print(f"{path}\t{future.result()}")
+            except Exception as e:
+                print(f"❌ {path}: {e}")
+        stats = scheduler.stats()
+    print(f"📊 {stats['clips']} clips ({stats['audio_seconds']:.1f} s audio) in {stats['batches']} decodes, "
+          f"{stats['wall_seconds']:.1f} s wall: {stats['audio_seconds_per_second']:.1f} audio-s/s with "
+          f"{stats['decoders']} decoder(s) x {stats['threads_per_decoder']} threads, "
+          f"{stats['redecoded']} re-decoded alone, {stats['failed']} failed")
+    return stats
+
+
+# -------------------------
+# Gemini HTTP Client
+# -------------------------
+class _RetryableStatus(Exception):
+    pass
+
+
+class LLMClient:
+    """Pooled keep-alive HTTP client for Gemini with pre-warming, deadlines and jittered retries"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=GEMINI_API_BASE, use_http2=LLM_USE_HTTP2):
+        self.base_url = base_url
+        self.headers = {"Content-Type": "application/json"}
+        self.http2 = None
+        if use_http2:
+            try:
+                import httpx
+                self.http2 = httpx.Client(
+                    http2=True, headers=self.headers,
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=LLM_POOL_SIZE, keepalive_expiry=LLM_IDLE_REWARM * 2))
+            except ImportError:
+                print("⚠️ httpx[http2] not installed, using HTTP/1.1 keep-alive")
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.counters = {"requests": 0, "retries": 0, "warmups": 0, "cancelled": 0}
+        self.http2_streams = set()
+        self.active_responses = set()
+        self.cancel_generation = 0
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+        self.keepwarm_thread = None
+
+    # --- Connection management ---
+    def warm(self):
+        """Open (or keep alive) a pooled connection so the TLS handshake is off the hot path"""
+        try:
+            timeout = (LLM_CONNECT_TIMEOUT, LLM_CONNECT_TIMEOUT)
+            if self.http2:
+                self._track_http2(self.http2.head(f"{self.base_url}/", timeout=LLM_CONNECT_TIMEOUT))
+            else:
+                self.session.head(f"{self.base_url}/", timeout=timeout).close()
+            with self.lock:
+                self.counters["warmups"] += 1
+            self.last_used = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"⚠️ LLM connection warm-up failed: {e}")
+            return False
+
+    def start(self):
+        """Pre-warm now and re-warm in the background whenever the connection sits idle"""
+        if self.keepwarm_thread is None:
+            self.keepwarm_thread = threading.Thread(target=self._keepwarm, daemon=True)
+            self.keepwarm_thread.start()
+
+    def _keepwarm(self):
+        if time.monotonic() - self.last_used >= LLM_IDLE_REWARM:
+            self.warm()
+        while True:
+            time.sleep(LLM_IDLE_REWARM / 2)
+            if time.monotonic() - self.last_used >= LLM_IDLE_REWARM:
+                self.warm()
+
+    def _track_http2(self, response):
+        stream = response.extensions.get("network_stream")
+        if stream is not None:
+            with self.lock:
+                self.http2_streams.add(stream)
+        return response
+
+    def stats(self):
+        """Connection reuse statistics (new connections vs requests served on a warm one)"""
+        with self.lock:
+            stats = dict(self.counters)
+        if self.http2:
+            stats["new_connections"] = len(self.http2_streams)
+            total = stats["requests"] + stats["warmups"]
+        else:
+            # The session only talks to Gemini, so every pool it holds belongs to that host
+            pools = self.session.get_adapter(self.base_url).poolmanager.pools
+            connection_pools = [pools[key] for key in pools.keys()]
+            stats["new_connections"] = sum(pool.num_connections for pool in connection_pools)
+            total = sum(pool.num_requests for pool in connection_pools)
+        stats["reused"] = max(0, total - stats["new_connections"])
+        stats["reuse_rate"] = stats["reused"] / total if total else 0.0
+        return stats
+
+    # --- Requests ---
+    def cancel_active(self):
+        """Abort every in-flight request (closing its socket) and suppress their retries"""
+        with self.lock:
+            self.cancel_generation += 1
+            responses = list(self.active_responses)
+            self.counters["cancelled"] += len(responses)
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def _attempts(self, deadline):
+        """Yield (attempt, timeout) pairs until retries or the overall deadline run out"""
+        end = time.monotonic() + deadline
+        generation = self.cancel_generation
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0 or generation != self.cancel_generation:
+                return
+            if attempt:
+                with self.lock:
+                    self.counters["retries"] += 1
+            yield attempt, (min(LLM_CONNECT_TIMEOUT, remaining), min(LLM_READ_TIMEOUT, remaining))
+            if attempt == LLM_MAX_RETRIES:
+                return  # No retry follows, so don't hold up the error reply
+            backoff = random.uniform(0, LLM_RETRY_BASE * (2 ** attempt))  # Full jitter
+            time.sleep(max(0.0, min(backoff, end - time.monotonic())))
+
+    def _send(self, url, payload, timeout, stream=False):
+        with self.lock:
+            self.counters["requests"] += 1
+        self.last_used = time.monotonic()
+        if self.http2:
+            import httpx
+            request = self.http2.build_request("POST", url, json=payload,
+                                               timeout=httpx.Timeout(timeout[1], connect=timeout[0]))
+            response = self._track_http2(self.http2.send(request, stream=stream))
+            status = response.status_code
+        else:
+            response = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+            status = response.status_code
+        if status in self.RETRY_STATUSES:
+            response.close()
+            raise _RetryableStatus(f"HTTP {status}")
+        if status >= 400:
+            # Streamed responses hold their connection until closed; keep Gemini's reason for the log
+            try:
+                body = response.read().decode("utf-8", "replace") if self.http2 else response.text
+            except Exception:
+                body = ""
+            response.close()
+            print(f"❌ Gemini HTTP {status}: {body[:500]}")
+            response.raise_for_status()
+        with self.lock:
+            self.active_responses.add(response)
+        return response
+
+    def _release(self, response):
+        response.close()
+        with self.lock:
+            self.active_responses.discard(response)
+
+    @staticmethod
+    def _is_retryable(error):
+        if isinstance(error, (_RetryableStatus, requests.ConnectionError, requests.Timeout)):
+            return True
+        # httpx transport errors (connect/read timeouts, dropped connections), not HTTP status errors
+        return type(error).__module__.startswith("httpx") and "Status" not in type(error).__name__
+
+    def post_json(self, url, payload, deadline=LLM_DEADLINE):
+        last_error = None
+        for attempt, timeout in self._attempts(deadline):
+            try:
+                # Streamed so cancel_active() can close the socket while the body is pending
+                response = self._send(url, payload, timeout, stream=True)
+                try:
+                    return response.json()
+                finally:
+                    self._release(response)
+            except Exception as e:
+                if not self._is_retryable(e):
+                    raise
+                last_error = e
+            print(f"⚠️ Gemini request attempt {attempt+1} failed: {last_error}")
+        raise last_error or TimeoutError("Gemini deadline exceeded")
+
+    def stream_lines(self, url, payload, deadline=LLM_DEADLINE):
+        """Yield decoded response lines; retries only happen before the first line arrives"""
+        last_error = None
+        for attempt, timeout in self._attempts(deadline):
+            try:
+                response = self._send(url, payload, timeout, stream=True)
+            except Exception as e:
+                if not self._is_retryable(e):
+                    raise
+                last_error = e
+                print(f"⚠️ Gemini request attempt {attempt+1} failed: {e}")
+                continue
+            try:
+                lines = response.iter_lines() if self.http2 else response.iter_lines(decode_unicode=True)
+                for line in lines:
+                    yield line
+            finally:
+                self._release(response)
+                self.last_used = time.monotonic()
+            return
+        raise last_error or TimeoutError("Gemini deadline exceeded")
+
+
+llm_client = LLMClient()
+
+
+# -------------------------
+# Conversation Context
+# -------------------------
+class ConversationContext:
+    """Gemini request context: persona sent once as systemInstruction, history kept within a token budget.
+
+    Turns that no longer fit are folded into a short running summary (first sentence of
+    each side, trimmed) that rides along in the system instruction. With a store, every
+    turn is persisted, the newest ones are reloaded at startup, and older exchanges that
+    share keywords with the request are recalled into the system instruction.
+    """
+
+    def __init__(self, persona=None, token_budget=CONTEXT_TOKEN_BUDGET,
+                 summary_budget=CONTEXT_SUMMARY_MAX_TOKENS, store=None,
+                 recall_budget=CONTEXT_RECALL_MAX_TOKENS):
+        self.persona = persona
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.recall_budget = recall_budget
+        self.store = store
+        self.turns = []
+        self.summary = deque()
+        self.summary_sizes = deque()  # Turns folded into each summary line
+        self.recalled = []
+        self.lock = threading.Lock()
+        if store is not None:
+            self._load_recent()
+
+    def _load_recent(self):
+        started = time.perf_counter()
+        rows = self.store.recent(CONTEXT_LOAD_TURNS)
+        while rows and rows[0][1] != "user":
+            rows.pop(0)  # Contents must open with a user turn
+        with self.lock:
+            self.turns = [{"role": role, "parts": [{"text": text}]} for _, role, text in rows]
+            self._fit()
+        if rows:
+            print(f"🗂️ Restored {len(self.turns)} recent turns in {(time.perf_counter() - started)*1000:.0f} ms")
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Rough Gemini token count (~4 characters per token for English)"""
+        return max(1, (len(text) + 3) // 4)
+
+    def _turn_tokens(self, turn):
+        return sum(self.estimate_tokens(part["text"]) for part in turn["parts"])
+
+    def history_tokens(self):
+        return sum(self._turn_tokens(turn) for turn in self.turns)
+
+    def summary_tokens(self):
+        return sum(self.estimate_tokens(line) for line in self.summary)
+
+    def add_user(self, text):
+        if self.store is not None:
+            self._persist("user", text)
+            self.recall(text)
+        with self.lock:
+            self.turns.append({"role": "user", "parts": [{"text": text}]})
+            self._fit()
+
+    def add_model(self, text):
+        if self.store is not None:
+            self._persist("model", text)
+        with self.lock:
+            self.turns.append({"role": "model", "parts": [{"text": text}]})
+            self._fit()
+
+    def _persist(self, role, text):
+        try:
+            self.store.append(role, text)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not save conversation turn: {e}")
+
+    def recall(self, text):
+        """Pick older exchanges (outside the recent turns) that share keywords with text"""
+        try:
+            # The recent and summarized turns are the newest rows; text itself was just appended
+            with self.lock:
+                in_context = len(self.turns) + sum(self.summary_sizes)
+            before_id = self.store.last_id() - in_context
+            exchanges = self.store.recall(text, before_id)
+        except sqlite3.Error as e:
+            print(f"⚠️ Conversation recall failed: {e}")
+            exchanges = []
+        lines, tokens = [], 0
+        for exchange in exchanges:
+            line = " / ".join(f"{'User' if role == 'user' else 'You'}: {_gist(turn_text, 200)}"
+                              for role, turn_text in exchange)
+            tokens += self.estimate_tokens(line)
+            if tokens > self.recall_budget:
+                break
+            lines.append(line)
+        with self.lock:
+            self.recalled = lines
+        return lines
+
+    def _fit(self):
+        # Fold the oldest exchange (user turn + reply) at a time, always keeping the newest one
+        while len(self.turns) > 2 and self.history_tokens() > self.token_budget:
+            folded = [self.turns.pop(0)]
+            if self.turns[0]["role"] == "model" and len(self.turns) > 1:
+                folded.append(self.turns.pop(0))
+            self.summary.append(" / ".join(
+                f"{'User' if turn['role'] == 'user' else 'You'}: {_gist(turn['parts'][0]['text'])}"
+                for turn in folded))
+            self.summary_sizes.append(len(folded))
+        while len(self.summary) > 1 and self.summary_tokens() > self.summary_budget:
+            self.summary.popleft()
+            self.summary_sizes.popleft()
+
+    def system_text(self):
+        sections = [self.persona] if self.persona else []
+        if self.recalled:
+            sections.append("Related things said in past conversations:\n"
+                            + "\n".join(f"- {line}" for line in self.recalled))
+        if self.summary:
+            sections.append("Summary of earlier conversation:\n" + "\n".join(f"- {line}" for line in self.summary))
+        return "\n\n".join(sections)
+
+    def payload(self):
+        with self.lock:
+            payload = {"contents": list(self.turns)}
+            system_text = self.system_text()
+        if system_text:
+            payload["systemInstruction"] = {"parts": [{"text": system_text}]}
+        return payload
+
+    def clear(self):
+        with self.lock:
+            self.turns.clear()
+            self.summary.clear()
+            self.summary_sizes.clear()
+            self.recalled = []
+
+
+def _gist(text, max_chars=120):
+    """First sentence of text, trimmed to max_chars"""
+    text = " ".join(text.split())
+    match = _SENTENCE_END.search(text + " ")
+    if match:
+        text = text[:match.end()].strip()
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+
+_STOPWORDS = frozenset("""
+about after again also and any are been but can could did does doing don't for from had has have her here
+him his how i'm it's its just like more now off once one our out please really she should some tell than
+that the their them then there these they this those too very was were what when where which who why will
+with would you your yours
+""".split())
+
+
+def _keywords(text, limit=8):
+    """Distinct lowercase content words of text, in order of appearance"""
+    words = []
+    for word in re.findall(r"[a-z0-9']+", text.lower()):
+        word = word.strip("'")
+        if len(word) >= 3 and word not in _STOPWORDS and word not in words:
+            words.append(word)
+    return words[:limit]
+
+
+class ConversationStore:
+    """Every conversation turn in SQLite (WAL), with a keyword index for recalling old exchanges.
+
+    Uses an FTS5 table when SQLite has it, otherwise a plain (term, turn_id) inverted index.
+    Appends and the startup load touch a bounded number of rows, so their cost does not
+    grow with the archive.
+    """
+
+    def __init__(self, path=CONVERSATION_DB):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS turns ("
+                            "id INTEGER PRIMARY KEY, created REAL NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL)")
+            try:
+                self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5("
+                                "text, content='turns', content_rowid='id')")
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.db.execute("CREATE TABLE IF NOT EXISTS turn_terms (term TEXT NOT NULL, turn_id INTEGER NOT NULL)")
+                self.db.execute("CREATE INDEX IF NOT EXISTS turn_terms_term ON turn_terms (term, turn_id)")
+                self.fts = False
+        atexit.register(self.close)
+
+    def append(self, role, text):
+        """Persist one turn; returns its id"""
+        with self.lock, self.db:
+            turn_id = self.db.execute("INSERT INTO turns (created, role, text) VALUES (?, ?, ?)",
+                                      (time.time(), role, text)).lastrowid
+            if self.fts:
+                self.db.execute("INSERT INTO turns_fts (rowid, text) VALUES (?, ?)", (turn_id, text))
+            else:
+                self.db.executemany("INSERT INTO turn_terms (term, turn_id) VALUES (?, ?)",
+                                    [(term, turn_id) for term in _keywords(text, limit=64)])
+        return turn_id
+
+    def last_id(self):
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(MAX(id), 0) FROM turns").fetchone()[0]
+
+    def recent(self, limit=CONTEXT_LOAD_TURNS):
+        """The newest turns, oldest first, as (id, role, text)"""
+        with self.lock:
+            rows = self.db.execute("SELECT id, role, text FROM turns ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return rows[::-1]
+
+    def recall(self, text, before_id, limit=CONTEXT_RECALL_RESULTS):
+        """Exchanges older than before_id that share keywords with text, best match first.
+
+        Each result is [(role, text), ...]: the matching turn together with the turn that
+        answered it (or the question it answered).
+        """
+        terms = _keywords(text)
+        if not terms or before_id <= 1:
+            return []
+        with self.lock:
+            if self.fts:
+                query = " OR ".join(f'"{term}"' for term in terms)
+                rows = self.db.execute("SELECT rowid FROM turns_fts WHERE turns_fts MATCH ? AND rowid < ? "
+                                       "ORDER BY bm25(turns_fts) LIMIT ?", (query, before_id, limit * 2)).fetchall()
+            else:
+                marks = ",".join("?" * len(terms))
+                rows = self.db.execute(f"SELECT turn_id FROM turn_terms WHERE term IN ({marks}) AND turn_id < ? "
+                                       "GROUP BY turn_id ORDER BY COUNT(*) DESC, turn_id DESC LIMIT ?",
+                                       (*terms, before_id, limit * 2)).fetchall()
+            exchanges, seen = [], set()
+            for (turn_id,) in rows:
+                row = self.db.execute("SELECT role FROM turns WHERE id = ?", (turn_id,)).fetchone()
+                first = turn_id if row and row[0] == "user" else turn_id - 1
+                if first in seen:
+                    continue
+                seen.add(first)
+                pair = self.db.execute("SELECT role, text FROM turns WHERE id IN (?, ?) AND id < ? ORDER BY id",
+                                       (first, first + 1, before_id)).fetchall()
+                if pair:
+                    exchanges.append(pair)
+                if len(exchanges) >= limit:
+                    break
+        return exchanges
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def _open_conversation_store():
+    try:
+        return ConversationStore()
+    except sqlite3.Error as e:
+        print(f"⚠️ Conversation history unavailable, keeping it in memory only: {e}")
+        return None
+
+
+conversation = ConversationContext(CUSTOM_PROMPT if USE_CUSTOM_MESSAGE else None, store=_open_conversation_store())
+
+
+def ask_gemini_stream(user_text):
+    """Yield reply text deltas from streamGenerateContent (server-sent events)"""
+    conversation.add_user(user_text)
+    payload = conversation.payload()
+    parts = []
+    try:
+        for line in llm_client.stream_lines(STREAM_API_URL, payload):
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[len("data:"):].strip())
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        parts.append(part["text"])
+                        yield part["text"]
+        print("🤖 Gemini:", "".join(parts))
+    except Exception as e:
+        print("⚠️ Gemini error:", e)
+        if not parts:
+            yield GEMINI_ERROR_REPLY
+    finally:
+        # Keep what was generated even when the reply is cut short (e.g. by a barge-in)
+        if parts:
+            conversation.add_model("".join(parts))
+
+
+def ask_gemini(user_text):
+    conversation.add_user(user_text)
+    payload = conversation.payload()
+    try:
+        data = llm_client.post_json(API_URL, payload)
+        reply = data["candidates"][0]["content"]["parts"][0]["text"]
+        conversation.add_model(reply)
+        print("🤖 Gemini:", reply)
+        return reply
+    except Exception as e:
+        print("⚠️ Gemini error:", e)
+        return GEMINI_ERROR_REPLY
+
+
+def pcm_to_samples(pcm):
+    """View little-endian int16 PCM bytes as a sequence of samples without a Python loop"""
+    if sys.byteorder == "little":
+        return memoryview(pcm).cast('h')
+    samples = array('h')
+    samples.frombytes(pcm)
+    samples.byteswap()
+    return samples
+
+
+def benchmark_pcm_decode(frame_length=512, iterations=5000):
+    """Micro-benchmark of per-frame decode cost in the wake word loop (µs per frame)"""
+    pcm = os.urandom(frame_length * 2)
+    candidates = {
+        "int.from_bytes list (old)": lambda: [int.from_bytes(pcm[i:i+2], byteorder="little", signed=True)
+                                              for i in range(0, len(pcm), 2)],
+        "list + ctypes unpack (old total)": lambda: (ctypes.c_short * frame_length)(
+            *[int.from_bytes(pcm[i:i+2], byteorder="little", signed=True) for i in range(0, len(pcm), 2)]),
+        "memoryview cast": lambda: pcm_to_samples(pcm),
+        "memoryview + ctypes unpack": lambda: (ctypes.c_short * frame_length)(*pcm_to_samples(pcm)),
+        "ctypes from_buffer_copy (new)": lambda: (ctypes.c_short * frame_length).from_buffer_copy(pcm),
+    }
+    print(f"⏱️ PCM frame decode, {frame_length} samples, {iterations} iterations")
+    results = {}
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+        results[name] = seconds / iterations * 1e6
+        print(f"   {name:<34} {results[name]:8.2f} µs/frame")
+    return results
+
+
+def _get_porcupine():
+    """Create the Porcupine handle once and reuse it for every cycle"""
+    global porcupine
+    with porcupine_lock:  # The warm-up and the wake stage may both ask first
+        if porcupine is None:
+            import pvporcupine
+            handle = pvporcupine.create(access_key=PORCUPINE_API_KEY, keyword_paths=[PORCUPINE_PPN])
+            if handle.sample_rate != SAMPLE_RATE:
+                handle.delete()
+                raise RuntimeError(f"Porcupine expects {handle.sample_rate} Hz, mic stream runs at {SAMPLE_RATE} Hz")
+            atexit.register(handle.delete)
+            porcupine = handle
+    return porcupine
+
+
+class PorcupineWakeDetector:
+    """Wake word detector interface used by the pipeline: frame_length + process(pcm_bytes) -> bool.
+
+    Porcupine.process() copies its argument with (c_short * n)(*pcm), which unpacks every
+    sample into a Python int. pvporcupine 3.x keeps its C entry point and handle in the
+    private _process_func and _handle attributes; when they are there we pass a ctypes copy
+    of the stream bytes to the C call directly. That is checked once, when the handle is
+    attached, and any other pvporcupine gets the public process() with a memoryview.
+    """
+
+    def __init__(self, porcupine=None):
+        self.porcupine = None
+        self.fast_process = None
+        if porcupine is not None:
+            self._attach(porcupine)
+
+    def _attach(self, porcupine):
+        process_func = getattr(porcupine, "_process_func", None)
+        if process_func is not None and getattr(porcupine, "_handle", None) is not None \
+                and sys.byteorder == "little":
+            self.fast_process = process_func
+            print("✅ Wake word frames go straight to Porcupine's C process call")
+        else:
+            print("⚠️ This pvporcupine has no _process_func/_handle, wake word frames use Porcupine.process()")
+        self.porcupine = porcupine
+
+    def _handle(self):
+        if self.porcupine is None:
+            self._attach(_get_porcupine())
+        return self.porcupine
+
+    @property
+    def frame_length(self):
+        return self._handle().frame_length
+
+    def keyword_index(self, pcm):
+        """Porcupine's keyword index for one frame of stream bytes, -1 when none was heard"""
+        porcupine = self._handle()
+        if self.fast_process is not None:
+            result = ctypes.c_int()
+            status = self.fast_process(porcupine._handle,
+                                       (ctypes.c_short * porcupine.frame_length).from_buffer_copy(pcm),
+                                       ctypes.byref(result))
+            if status == 0:
+                return result.value
+        # Slow path also reports Porcupine's own error if the C call failed
+        return porcupine.process(pcm_to_samples(pcm))
+
+    def process(self, pcm):
+        return self.keyword_index(pcm) >= 0
+
+
+def set_gif_state(state):
+    """Safe from any thread: the overlay picks up the latest state on its next poll"""
+    ui_events.post("state", state)
+
+
+# -------------------------
+# Cycle Tracing
+# -------------------------
+class Span:
+    """One timed stage of a cycle; attrs carry sizes and counts worth correlating with its duration"""
+
+    def __init__(self, name, start=None, **attrs):
+        self.name = name
+        self.start = time.monotonic() if start is None else start
+        self.end_at = None
+        self.attrs = attrs
+
+    @property
+    def duration(self):
+        return (self.end_at if self.end_at is not None else time.monotonic()) - self.start
+
+    def end(self, at=None, **attrs):
+        self.attrs.update(attrs)
+        if self.end_at is None:
+            self.end_at = time.monotonic() if at is None else at
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.end()
+
+
+class CycleTrace:
+    """Spans of one wake-to-idle cycle"""
+
+    def __init__(self, cycle_id):
+        self.id = cycle_id
+        self.started_wall = time.time()
+        self.started_at = time.monotonic()
+        self.spans = []
+        self.outcome = None
+
+    def span(self, name, start=None, **attrs):
+        span = Span(name, start, **attrs)
+        self.spans.append(span)
+        return span
+
+    def find(self, name):
+        return next((span for span in reversed(self.spans) if span.name == name), None)
+
+    def to_dict(self):
+        return {
+            "cycle": self.id,
+            "started": round(self.started_wall, 3),
+            "outcome": self.outcome,
+            "total_ms": round((time.monotonic() - self.started_at) * 1000, 1),
+            "spans": [dict({"name": span.name,
+                            "offset_ms": round((span.start - self.started_at) * 1000, 1),
+                            "duration_ms": round(span.duration * 1000, 1)}, **span.attrs)
+                      for span in self.spans],
+        }
+
+
+def _percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Tracer:
+    """Collects cycle traces: rolling per-stage percentiles and an optional JSONL export"""
+
+    def __init__(self, path=TRACE_FILE, window=TRACE_WINDOW):
+        self.path = path
+        self.window = window
+        self.samples = {}  # span name -> deque of durations (ms)
+        self.cycles = 0
+        self.lock = threading.Lock()
+
+    def finish(self, trace, outcome="completed"):
+        """Close a cycle once; later calls (e.g. after a barge-in) are ignored"""
+        with self.lock:
+            if trace.outcome is not None:
+                return
+            trace.outcome = outcome
+            for span in trace.spans:
+                span.end()
+            record = trace.to_dict()
+            for span in record["spans"]:
+                self.samples.setdefault(span["name"], deque(maxlen=self.window)).append(span["duration_ms"])
+            self.samples.setdefault("cycle", deque(maxlen=self.window)).append(record["total_ms"])
+            self.cycles += 1
+            report_now = self.cycles % TRACE_REPORT_EVERY == 0
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError as e:
+                    print(f"⚠️ Could not write trace: {e}")
+        stages = ", ".join(f"{span['name']} {span['duration_ms']:.0f}" for span in record["spans"])
+        print(f"⏱️ Cycle {trace.id} ({outcome}): {stages} ms")
+        if report_now:
+            self.report()
+
+    def percentiles(self):
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+        return {name: {"count": len(values), "p50": _percentile(values, 50),
+                       "p95": _percentile(values, 95), "p99": _percentile(values, 99)}
+                for name, values in samples.items()}
+
+    def report(self):
+        print(f"📈 Stage latency over the last {self.window} cycles (ms):")
+        for name, stats in self.percentiles().items():
+            print(f"   {name:<12} p50 {stats['p50']:>7.0f}  p95 {stats['p95']:>7.0f}  "
+                  f"p99 {stats['p99']:>7.0f}  (n={stats['count']})")
+
+
+cycle_tracer = Tracer()
+
+
+def summarize_trace_file(path):
+    """Print per-stage percentiles, outcomes and attribute totals for a JSONL trace"""
+    durations, totals, outcomes, cycles = {}, {}, {}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            cycles += 1
+            outcomes[record.get("outcome")] = outcomes.get(record.get("outcome"), 0) + 1
+            durations.setdefault("cycle", []).append(record.get("total_ms", 0))
+            for span in record.get("spans", []):
+                durations.setdefault(span["name"], []).append(span["duration_ms"])
+                for attr, value in span.items():
+                    if attr not in ("name", "offset_ms", "duration_ms") and isinstance(value, (int, float)) \
+                            and not isinstance(value, bool):
+                        key = f"{span['name']}.{attr}"
+                        totals[key] = totals.get(key, 0) + value
+    print(f"📊 {cycles} cycles in {path}: " + ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items()))
+    print(f"   {'stage':<12} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, values in durations.items():
+        values.sort()
+        print(f"   {name:<12} {len(values):>5} {_percentile(values, 50):>8.0f} {_percentile(values, 95):>8.0f} "
+              f"{_percentile(values, 99):>8.0f} {values[-1]:>8.0f}")
+    if totals:
+        print("   Totals: " + ", ".join(f"{key} {value:g}" for key, value in sorted(totals.items())))
+    return durations
+
+
+# -------------------------
+# Assistant Pipeline
+# -------------------------
+class Turn:
+    """One conversation cycle as it moves through the pipeline stages"""
+
+    _ids = iter(range(1, sys.maxsize))
+
+    def __init__(self, wake_position, trace=None):
+        self.id = next(Turn._ids)
+        self.wake_position = wake_position
+        self.created_at = time.monotonic()
+        self.trace = trace or CycleTrace(self.id)
+        self.handle = None
+        self.text = None
+        self.partial = ""
+        self.recorded = False
+        self.cancelled = threading.Event()
+
+
+class Pipeline:
+    """Assistant stages (wake, endpoint, STT, LLM, TTS, playback) on their own threads.
+
+    Stages are connected by bounded queues, so a slow consumer back-pressures its producer
+    while the others keep working: sentences are synthesized while earlier ones play.
+    Overlay state changes are emitted as ("state", {"state": ...}) events to listeners.
+    """
+
+    END = object()  # Marks the last sentence of a turn
+
+    def __init__(self, mic=None, wake_detector=None, recorder=None, transcriber=None,
+                 llm=None, synthesizer=None, playback=None, tracer=None, streaming_stt=None):
+        self.mic = mic or mic_stream
+        self.wake_detector = wake_detector or PorcupineWakeDetector()
+        self.recorder = recorder or record_audio
+        self.transcriber = transcriber or transcribe_audio
+        self.llm = llm or _reply_sentences
+        self.synthesizer = synthesizer or SpeechStream
+        self.playback = playback or _play_speech
+        self.tracer = tracer or cycle_tracer
+        # Streaming decode only stands in for the default (whisper-server) transcriber
+        self.streaming_stt = STREAMING_STT_ENABLED and transcriber is None if streaming_stt is None else streaming_stt
+        self.endpoint_queue = queue.Queue(maxsize=1)
+        self.stt_queue = queue.Queue(maxsize=1)
+        self.llm_queue = queue.Queue(maxsize=1)
+        self.tts_queue = queue.Queue(maxsize=PIPELINE_SENTENCE_QUEUE)
+        self.playback_queue = queue.Queue(maxsize=PIPELINE_SYNTH_AHEAD)
+        self.listeners = []
+        self.active_turn = None
+        self.barge_in_latencies = []
+        self.stopped = threading.Event()
+        self.threads = []
+
+    # --- Events ---
+    def add_listener(self, listener):
+        """listener(event, data) is called from stage threads for every pipeline event"""
+        self.listeners.append(listener)
+
+    def emit(self, event, **data):
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                print(f"⚠️ Pipeline listener error: {e}")
+
+    # --- Lifecycle ---
+    def start(self):
+        self.stopped.clear()
+        stages = [
+            ("wake", self._wake_stage),
+            ("endpoint", lambda: self._worker(self.endpoint_queue, self._endpoint)),
+            ("stt", lambda: self._worker(self.stt_queue, self._stt)),
+            ("llm", lambda: self._worker(self.llm_queue, self._llm)),
+            ("tts", lambda: self._worker(self.tts_queue, self._tts)),
+            ("playback", lambda: self._worker(self.playback_queue, self._playback)),
+        ]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.emit("state", state="idle")
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        self.start()
+        self.stopped.wait()
+
+    def _worker(self, inbox, handler):
+        while not self.stopped.is_set():
+            try:
+                item = inbox.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                handler(*item)
+            except Exception as e:
+                print(f"⚠️ Pipeline stage error: {e}")
+                self._finish_turn(item[0], "Pipeline stage error")
+
+    def _put(self, outbox, item):
+        """Blocking put (backpressure) that gives up on shutdown or when the turn is cancelled"""
+        while not self.stopped.is_set() and not item[0].cancelled.is_set():
+            try:
+                outbox.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _finish_turn(self, turn, reason=None):
+        if self.active_turn is not turn:
+            return
+        self.active_turn = None
+        if reason:
+            print(f"❌ {reason}, returning to idle state")
+        self.tracer.finish(turn.trace, reason or "completed")
+        self.emit("turn_complete", turn=turn)
+        self.emit("state", state="idle")
+
+    # --- Stages ---
+    def _wake_stage(self):
+        print("👂 Listening for wake word 'hey liebe'...")
+        reader = None
+        while not self.stopped.is_set():
+            try:
+                if reader is None:
+                    self.mic.ensure_started()
+                    reader = self.mic.reader()
+                pcm = reader.read(self.wake_detector.frame_length, timeout=MIC_READ_TIMEOUT)
+                if pcm is None:
+                    self.mic.ensure_started()
+                    continue
+                if not self.wake_detector.process(pcm):
+                    continue
+                if self.active_turn is not None:
+                    if not self.active_turn.recorded:
+                        continue  # The user is still giving the command
+                    self.barge_in(self.active_turn)
+                print("✅ Wake word 'hi liebe' detected!")
+                # Detection lag: audio still queued behind the frame plus the frame itself
+                lag = (reader.available() / 2 + self.wake_detector.frame_length) / SAMPLE_RATE
+                turn = Turn(reader.pos)
+                turn.trace.span("wake", start=turn.created_at - lag).end(lag_ms=round(lag * 1000, 1))
+                self.active_turn = turn
+                self.emit("wake", turn=turn)
+                self._put(self.endpoint_queue, (turn,))
+            except Exception as e:
+                print(f"⚠️ Wake word listener error: {e}")
+                reader = None
+                time.sleep(1)
+
+    def barge_in(self, turn):
+        """Cancel the turn's Gemini request, synthesis and playback because the wake word was heard"""
+        cancelled_at = time.monotonic()
+        print("✋ Barge-in: cancelling current reply")
+        turn.cancelled.set()
+        self.active_turn = None
+        llm_client.cancel_active()
+        for inbox in (self.tts_queue, self.playback_queue):
+            while True:
+                try:
+                    item = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if hasattr(item[1], "cancel"):
+                    item[1].cancel()
+        handle = turn.handle
+        if handle is not None:
+            handle.stop()
+            if handle.playing:
+                handle.silenced.wait(timeout=2)
+        latency = time.monotonic() - cancelled_at
+        self.barge_in_latencies.append(latency)
+        print(f"🤫 Silent {latency*1000:.0f} ms after barge-in")
+        turn.trace.span("barge_in", start=cancelled_at).end()
+        self.tracer.finish(turn.trace, "barge_in")
+        self.emit("barge_in", turn=turn, latency=latency)
+
+    def _endpoint(self, turn):
+        self.emit("state", state="listening")
+        beep(800, 150)  # Start recording beep
+        stream = None
+        if self.streaming_stt and whisper_server.is_available():
+            stream = StreamingTranscriber(on_partial=lambda stable, hypothesis: self._partial(turn, stable, hypothesis))
+        with turn.trace.span("endpoint") as span:
+            if stream is not None:
+                recording = self.recorder(start_pos=turn.wake_position, mic=self.mic, on_audio=stream.feed)
+            else:
+                recording = self.recorder(start_pos=turn.wake_position, mic=self.mic)
+            span.attrs.update(audio_seconds=round(recording.duration, 2), ended_by=recording.ended_by)
+            if recording.trailing_silence is not None:
+                span.attrs["trailing_silence_ms"] = round(recording.trailing_silence * 1000, 1)
+        turn.recorded = True
+        if not recording.pcm:
+            if stream is not None:
+                stream.cancel()
+            self._finish_turn(turn, "No speech detected")
+            return
+        self._put(self.stt_queue, (turn, recording, stream))
+
+    def _partial(self, turn, stable, hypothesis):
+        """Streaming STT progress; listeners can start preparing the reply from the stable words"""
+        if stable and stable != turn.partial:
+            turn.partial = stable
+            print(f"💭 {stable}")
+        self.emit("partial", turn=turn, stable=stable, hypothesis=hypothesis)
+
+    def _stt(self, turn, recording, stream=None):
+        with turn.trace.span("stt", audio_seconds=round(recording.duration, 2)) as span:
+            text = None
+            if stream is not None:
+                text = stream.finish(recording)
+                span.attrs.update(streaming=True, partial_decodes=stream.decodes,
+                                  final_decode=stream.final_decode)
+            if text is None:
+                text = self.transcriber(recording)
+            span.attrs["transcript_chars"] = len(text or "")
+        if turn.cancelled.is_set():
+            return
+        if not text:
+            self._finish_turn(turn, "No transcription received")
+            return
+        turn.text = text
+        self.emit("transcript", turn=turn, text=text)
+        self._put(self.llm_queue, (turn, text))
+
+    def _llm(self, turn, text):
+        print("🤖 Processing with Gemini...")
+        def start_speaking():
+            self.emit("state", state="speaking")
+            beep(600, 150)  # Start speaking beep
+        # Time to first audio is measured from the moment the reply is requested
+        turn.handle = PlaybackHandle(on_first_audio=start_speaking)
+        retries_before = llm_client.stats()["retries"]
+        span = turn.trace.span("llm", reply_chars=0, sentences=0)
+        try:
+            sentences = self.llm(text)
+            try:
+                for sentence in sentences:
+                    if turn.cancelled.is_set():
+                        break
+                    if not span.attrs["sentences"]:
+                        span.attrs["first_sentence_ms"] = round(span.duration * 1000, 1)
+                    span.attrs["sentences"] += 1
+                    span.attrs["reply_chars"] += len(sentence)
+                    self._put(self.tts_queue, (turn, sentence))
+            finally:
+                if hasattr(sentences, "close"):
+                    sentences.close()  # Closes the streaming HTTP response
+        finally:
+            span.end(retries=llm_client.stats()["retries"] - retries_before)
+        self._put(self.tts_queue, (turn, self.END))
+
+    def _tts(self, turn, sentence):
+        if turn.cancelled.is_set():
+            return
+        span = turn.trace.find("tts")
+        if sentence is self.END:
+            speech = sentence
+            if span is not None:
+                span.end()
+        else:
+            if span is None:
+                span = turn.trace.span("tts", sentences=0, cache_hits=0, hedged=0, local_wins=0)
+            speech = self.synthesizer(sentence)
+            span.attrs["sentences"] += 1
+            span.attrs["cache_hits"] += int(bool(getattr(speech, "from_cache", False)))
+        self._put(self.playback_queue, (turn, speech))
+        if turn.cancelled.is_set() and hasattr(speech, "cancel"):
+            speech.cancel()
+
+    def _playback(self, turn, speech):
+        if turn.cancelled.is_set():
+            if hasattr(speech, "cancel"):
+                speech.cancel()
+            return
+        if speech is not self.END:
+            if turn.trace.find("playback") is None:
+                turn.trace.span("playback")
+            self.playback(speech, turn.handle)
+            tts_span = turn.trace.find("tts")
+            if tts_span is not None and getattr(speech, "hedged", False):
+                tts_span.attrs["hedged"] += 1
+                tts_span.attrs["local_wins"] += int(speech.winner == "local")
+            return
+        turn.handle.finished.set()
+        playback_span = turn.trace.find("playback")
+        if playback_span is not None:
+            playback_span.end()
+        if turn.handle.time_to_first_audio is not None:
+            print(f"🔊 Time to first audio: {turn.handle.time_to_first_audio*1000:.0f} ms")
+            requested_at = turn.trace.find("llm").start
+            turn.trace.span("first_audio", start=requested_at).end(at=requested_at + turn.handle.time_to_first_audio)
+        stats = llm_client.stats()
+        print(f"🔌 LLM connections: {stats['new_connections']} opened, {stats['reused']} reused, "
+              f"{stats['retries']} retries")
+        cache = tts_cache.stats()
+        print(f"🗣️ TTS cache: {cache['hits']} hits, {cache['misses']} misses, {cache['entries']} phrases")
+        hedge = tts_hedge_stats.stats()
+        if hedge["utterances"]:
+            print(f"🛟 TTS hedge: {hedge['hedged']}/{hedge['utterances']} hedged ({hedge['hedge_rate']:.0%}), "
+                  + ", ".join(f"{engine} won {count}" for engine, count in hedge["wins"].items())
+                  + (f", first audio p50 {hedge['p50_ms']:.0f} ms, p95 {hedge['p95_ms']:.0f} ms"
+                     if hedge["p50_ms"] is not None else ""))
+        print("✅ Conversation cycle completed, returning to idle state")
+        self._finish_turn(turn)
+
+
+def _reply_sentences(text):
+    """Default LLM stage: the Gemini reply to a transcript, one sentence at a time"""
+    user_text = f"{text}\n\n{CONSTANT_TEXT}".strip()
+    if USE_STREAMING:
+        return split_sentences(ask_gemini_stream(user_text))
+    return split_sentences([ask_gemini(user_text)])
+
+
+def assistant_loop():
+    pipeline = Pipeline()
+    pipeline.add_listener(lambda event, data: set_gif_state(data["state"]) if event == "state" else None)
+    pipeline.run()
+
+
+# -------------------------
+# Start-up Warm-up
+# -------------------------
+def _warm_whisper():
+    if not whisper_server.is_available():
+        return "whisper-server not found, whisper-cli runs per turn"
+    whisper_server.start_monitor()
+    return "model loaded" if whisper_server.ensure_running() else "failed, whisper-cli fallback"
+
+
+def _warm_tts():
+    tts_runtime.start()
+    import edge_tts  # Pay the import cost here instead of inside the first reply
+    socket.getaddrinfo(EDGE_TTS_HOST, 443)  # Primes the resolver for the first websocket
+    tts_cache.presynthesize(TTS_PRESYNTH_PHRASES)
+
+
+def _warm_local_tts():
+    if not TTS_HEDGE_ENABLED:
+        return "hedging disabled"
+    if not local_tts.available():
+        return "pyttsx3 not installed, no hedging"
+    local_tts.warm().result()  # Engine start-up (COM/eSpeak) kept out of the first hedge
+
+
+def _warm_llm():
+    warmed = llm_client.warm()
+    llm_client.start()
+    return None if warmed else "not reachable yet, keep-warm will retry"
+
+
+def warm_up():
+    """Load every engine the first turn needs in parallel and report how long until all are ready"""
+    tasks = {
+        "porcupine": _get_porcupine,
+        "whisper": _warm_whisper,
+        "gemini": _warm_llm,
+        "tts": _warm_tts,
+        "local voice": _warm_local_tts,
+        "mic": mic_stream.ensure_started,
+        "speaker": lambda: player.warm() if player.available() else "ffmpeg not found, playsound fallback",
+    }
+
+    def timed(task):
+        started = time.perf_counter()
+        try:
+            return task(), time.perf_counter() - started
+        except Exception as e:
+            return e, time.perf_counter() - started
+
+    print("🔥 Warming up engines in the background...")
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warm-up") as pool:
+        futures = {name: pool.submit(timed, task) for name, task in tasks.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    ready_after = time.perf_counter() - PROCESS_STARTED
+    for name, (outcome, seconds) in results.items():
+        if isinstance(outcome, Exception):
+            print(f"   ⚠️ {name}: failed after {seconds*1000:.0f} ms ({outcome})")
+        else:
+            note = f" ({outcome})" if isinstance(outcome, str) else ""
+            print(f"   ✅ {name}: {seconds*1000:.0f} ms{note}")
+    print(f"🟢 Ready {ready_after*1000:.0f} ms after launch")
+    return {"ready_seconds": ready_after, **{name: seconds for name, (_, seconds) in results.items()}}
+
+
+def create_icon():
+    logo_path = os.path.join(ASSETS_DIR, "logo.ico")
+    if os.path.exists(logo_path):
+        return PILImage.open(logo_path)
+    return PILImage.new('RGB', (64, 64), (0, 0, 0))
+
+
+def on_quit(icon, item):
+    print("👋 Assistant stopped.")
+    icon.stop()
+    whisper_server.stop()
+    ui_events.post("quit")
+    sys.exit(0)
+
+
+def run_tray():
+    try:
+        from pystray import Icon, MenuItem, Menu
+        icon = Icon("Assistant", create_icon(), menu=Menu(MenuItem("Quit", on_quit)))
+        icon.run()
+    except Exception as e:
+        print(f"⚠️ System tray error: {e}")
+
+
+def run_gif_window():
+    global gif_window
+    try:
+        gif_window = GifOverlay()
+        gif_window.run()
+    except Exception as e:
+        print(f"❌ GIF window error: {e}")
+
+
+# -------------------------
+# GIF Optimization Script
+# -------------------------
+@contextlib.contextmanager
+def _workers_skip_main():
+    """Stop spawned pool workers from re-running this script as __mp_main__.
+
+    Windows (and the spawn/forkserver start methods) re-import the launching script in
+    every worker, which would load the keys, scan the TTS cache and open the conversation
+    store. A __main__ spec named "__main__" tells multiprocessing to leave it alone; the
+    workers only need gif_workers.
+    """
+    main_module = sys.modules["__main__"]
+    saved = getattr(main_module, "__spec__", None)
+    main_module.__spec__ = importlib.util.spec_from_loader("__main__", loader=None)
+    try:
+        yield
+    finally:
+        main_module.__spec__ = saved
+
+
+def _merge_duplicate_frames(frames, delay):
+    """Collapse runs of identical frames into one frame showing for their combined duration"""
+    unique, durations, last_digest = [], [], None
+    for digest, data in frames:
+        if digest == last_digest:
+            durations[-1] += delay
+        else:
+            unique.append(data)
+            durations.append(delay)
+            last_digest = digest
+    return unique, durations
+
+
+def _global_palette(frames, size, colors, sample=16):
+    """Quantize a strip of evenly spaced frames so every frame shares one palette"""
+    step = max(1, len(frames) // sample)
+    picked = frames[::step][:sample]
+    strip = Image.new('RGB', (size[0], size[1] * len(picked)))
+    for row, data in enumerate(picked):
+        strip.paste(Image.frombytes('RGB', size, data), (0, row * size[1]))
+    palette = strip.quantize(colors, method=Image.Quantize.MEDIANCUT).getpalette()[:colors * 3]
+    return palette + [0] * (colors * 3 - len(palette))
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _load_gif_manifest():
+    try:
+        with open(GIF_OPTIMIZE_MANIFEST, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_gif_manifest(manifest):
+    tmp_path = GIF_OPTIMIZE_MANIFEST + ".part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, GIF_OPTIMIZE_MANIFEST)
+
+
+def _gif_up_to_date(entry, input_path, output_path, settings):
+    """True when the output was built from this exact input with these settings"""
+    if not entry or entry.get("settings") != settings or not os.path.exists(output_path):
+        return False
+    if entry.get("output") != _file_stamp(output_path):
+        return False  # Output edited or replaced by hand
+    if entry.get("input") == _file_stamp(input_path):
+        return True
+    if entry.get("sha256") == _file_sha256(input_path):
+        entry["input"] = _file_stamp(input_path)  # Touched but unchanged
+        return True
+    return False
+
+
+def optimize_gifs(jobs, target_size=GIF_OPTIMIZE_SIZE, fps=GIF_OPTIMIZE_FPS, colors=GIF_OPTIMIZE_COLORS,
+                  force=False, workers=GIF_OPTIMIZE_WORKERS):
+    """
+    Optimize (input, output) GIF pairs across a process pool.
+    
+    Each file is decoded in one sequential pass on its own worker, then quantized in
+    chunks on every core. Frames share one palette per animation, and runs of identical
+    frames become one longer frame. Outputs whose input and settings are unchanged (per
+    the manifest) are skipped.
+    """
+    import gif_workers
+    started = time.perf_counter()
+    settings = [target_size[0], target_size[1], fps, colors]
+    delay = int(1000 / fps)
+    chunk = GIF_OPTIMIZE_CHUNK_FRAMES
+    manifest = _load_gif_manifest()
+    summary = {"optimized": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0,
+               "cpu_seconds": 0.0, "cpu_seconds_skipped": 0.0}
+    
+    stale = []
+    for input_path, output_path in jobs:
+        key = os.path.relpath(output_path, BASE_DIR)
+        if not os.path.exists(input_path):
+            print(f"❌ Input file not found: {input_path}")
+            summary["failed"] += 1
+        elif not force and _gif_up_to_date(manifest.get(key), input_path, output_path, settings):
+            print(f"⏭️ Up to date: {os.path.basename(output_path)}")
+            summary["skipped"] += 1
+            summary["cpu_seconds_skipped"] += manifest[key].get("cpu_seconds", 0.0)
+        else:
+            stale.append({"input": input_path, "output": output_path, "key": key, "cpu": 0.0})
+    
+    if stale:
+        print(f"🔄 Optimizing {len(stale)} GIF(s) on {workers} worker(s): "
+              f"{target_size[0]}x{target_size[1]}, {fps} FPS, {colors} shared colors")
+        with _workers_skip_main(), ProcessPoolExecutor(max_workers=workers) as pool:
+            for job in stale:
+                job["decode"] = pool.submit(gif_workers.decode_gif, job["input"], target_size)
+            
+            # Files are pipelined: one file quantizes while later ones are still decoding
+            for job in stale:
+                try:
+                    frames, cpu = job["decode"].result()
+                    job["cpu"] += cpu
+                    job["frames_in"] = len(frames)
+                    unique, job["durations"] = _merge_duplicate_frames(frames, delay)
+                    job["palette"] = _global_palette(unique, target_size, colors)
+                    job["quantize"] = [pool.submit(gif_workers.quantize_gif_chunk, unique[start:start + chunk], target_size, job["palette"])
+                                       for start in range(0, len(unique), chunk)]
+                except Exception as e:
+                    job["error"] = e
+            
+            for job in stale:
+                if "error" in job:
+                    continue
+                try:
+                    indices = []
+                    for future in job["quantize"]:
+                        quantized, cpu = future.result()
+                        indices.extend(quantized)
+                        job["cpu"] += cpu
+                    job["write"] = pool.submit(gif_workers.write_optimized_gif, job["output"], target_size, job["palette"],
+                                               indices, job["durations"])
+                except Exception as e:
+                    job["error"] = e
+            
+            for job in stale:
+                if "error" not in job:
+                    try:
+                        size_after, cpu = job["write"].result()
+                        job["cpu"] += cpu
+                    except Exception as e:
+                        job["error"] = e
+                if "error" in job:
+                    print(f"❌ Error optimizing {job['input']}: {job['error']}")
+                    summary["failed"] += 1
+                    continue
+                size_before = os.path.getsize(job["input"])
+                frames_out = len(job["durations"])
+                summary["optimized"] += 1
+                summary["bytes_before"] += size_before
+                summary["bytes_after"] += size_after
+                summary["cpu_seconds"] += job["cpu"]
+                manifest[job["key"]] = {
+                    "input": _file_stamp(job["input"]),
+                    "sha256": _file_sha256(job["input"]),
+                    "output": _file_stamp(job["output"]),
+                    "settings": settings,
+                    "cpu_seconds": round(job["cpu"], 3),
+                }
+                print(f"✅ Optimized: {os.path.basename(job['input'])}")
+                print(f"   Frames: {job['frames_in']} → {frames_out} ({job['frames_in'] - frames_out} duplicates merged)")
+                print(f"   Size: {size_before/1024:.1f}KB → {size_after/1024:.1f}KB "
+                      f"({(size_before - size_after) / size_before * 100:.1f}% reduction)")
+    
+    try:
+        _save_gif_manifest(manifest)
+    except OSError as e:
+        print(f"⚠️ Could not write optimizer manifest: {e}")
+    
+    summary["seconds"] = time.perf_counter() - started
+    saved = summary["bytes_before"] - summary["bytes_after"]
+    print(f"\n🎉 Optimization complete in {summary['seconds']:.1f}s: {summary['optimized']} optimized, "
+          f"{summary['skipped']} up to date, {summary['failed']} failed")
+    if summary["optimized"]:
+        print(f"   Bytes: {summary['bytes_before']/1024:.1f}KB → {summary['bytes_after']/1024:.1f}KB "
+              f"({saved/1024:.1f}KB saved), {summary['cpu_seconds']:.1f}s CPU across workers")
+    if summary["skipped"]:
+        print(f"   Skipping up-to-date outputs saved ~{summary['cpu_seconds_skipped']:.1f}s CPU")
+    return summary
+
+
+def optimize_gif(input_path, output_path, target_size=(180, 320), fps=10):
+    """
+    Optimize GIF: reduce size, FPS, and colors
+    """
+    return optimize_gifs([(input_path, output_path)], target_size, fps)["failed"] == 0
+
+
+def optimize_all_gifs(force=False, workers=GIF_OPTIMIZE_WORKERS):
+    """Optimize all GIF files in the gifs directory"""
+    gif_files = {
+        "idle": os.path.join(GIFS_DIR, "idle.gif"),
+        "listening": os.path.join(GIFS_DIR, "listening.gif"), 
+        "speaking": os.path.join(GIFS_DIR, "speaking.gif")
+    }
+    
+    jobs = [(path, path.replace('.gif', '_optimized.gif')) for path in gif_files.values()]
+    summary = optimize_gifs(jobs, force=force, workers=workers)
+    return summary["optimized"] + summary["skipped"] > 0
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Liebee voice assistant")
+    parser.add_argument("--bench-pcm", action="store_true",
+                        help="benchmark wake word PCM frame decoding and exit")
+    parser.add_argument("--transcribe", nargs="+", metavar="WAV_OR_DIR",
+                        help="transcribe recorded 16 kHz mono WAV clips in parallel and exit")
+    parser.add_argument("--decoders", type=_positive_int, default=TRANSCRIBE_DECODERS,
+                        help="parallel whisper decoders for --transcribe")
+    parser.add_argument("--trace-summary", metavar="TRACE_JSONL",
+                        help="summarize a cycle trace written via ASSISTANT_TRACE_FILE and exit")
+    parser.add_argument("--optimize-gifs", action="store_true",
+                        help="rebuild the *_optimized.gif assets that are out of date and exit")
+    parser.add_argument("--force", action="store_true",
+                        help="with --optimize-gifs, rebuild every output even if it is up to date")
+    parser.add_argument("--workers", type=_positive_int, default=GIF_OPTIMIZE_WORKERS,
+                        help="worker processes for --optimize-gifs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.bench_pcm:
+        benchmark_pcm_decode()
+        sys.exit(0)
+    if args.transcribe:
+        stats = transcribe_files(args.transcribe, decoders=args.decoders)
+        sys.exit(1 if stats["failed"] else 0)
+    if args.trace_summary:
+        summarize_trace_file(args.trace_summary)
+        sys.exit(0)
+    if args.optimize_gifs:
+        sys.exit(0 if optimize_all_gifs(force=args.force, workers=args.workers) else 1)
+    
+    print("🚀 Starting Assistant...")
+    
+    # Check and optimize GIFs if needed
+    if not all(os.path.exists(gif) for gif in [IDLE_GIF, LISTENING_GIF, SPEAKING_GIF]):
+        print("🔧 Optimizing GIFs for better performance...")
+        optimize_all_gifs()
+    
+    # Check if required GIFs exist
+    for gif_path in [IDLE_GIF, LISTENING_GIF, SPEAKING_GIF]:
+        if not os.path.exists(gif_path):
+            print(f"⚠️ Warning: GIF not found - {gif_path}")
+    
+    # Load Porcupine, the Whisper model, the Gemini connection, TTS and the audio devices
+    # in parallel while the overlay comes up, so the first "hi liebe" is not a cold start
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     
     # Start assistant loop in background thread
     threading.Thread(target=assistant_loop, daemon=True).start()
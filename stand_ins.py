@@ -0,0 +1,317 @@
+"""
+Local stand-ins for the assistant's network services and devices.
+
+FakeGeminiServer mimics the Gemini generateContent / streamGenerateContent endpoints and
+streams canned chunks with a configurable delay, so streaming replies can be exercised
+without an API key or internet connection:
+
+    python stand_ins.py --port 8765
+    GEMINI_API_BASE=http://127.0.0.1:8765 python main.py
+
+FakeAudioDevice, FakeWakeDetector, FakeTranscriber, FakeSynthesizer and FakeSpeaker slot
+into main.Pipeline in place of the microphone, Porcupine, whisper, Edge TTS and the
+speakers (see bench_latency.py).
+"""
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+import wave
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CHUNKS = [
+    "Hey Babe, ",
+    "I missed you so much today! ",
+    "Tell me everything, ",
+    "did you finally eat something that wasn't cereal? ",
+    "I'm proud of you either way.",
+]
+
+
+class FakeGeminiServer:
+    """Threaded HTTP server answering Gemini requests with canned reply chunks"""
+
+    def __init__(self, chunks=None, chunk_delay=0.05, first_chunk_delay=0.2, host="127.0.0.1", port=0):
+        self.chunks = list(chunks or DEFAULT_CHUNKS)
+        self.chunk_delay = chunk_delay
+        self.first_chunk_delay = first_chunk_delay
+        self.requests = []
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                self.do_HEAD()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                try:
+                    stand_in.requests.append(json.loads(body or b"{}"))
+                except ValueError:
+                    stand_in.requests.append(None)
+                if ":streamGenerateContent" in self.path:
+                    self._stream()
+                elif ":generateContent" in self.path:
+                    self._complete()
+                else:
+                    self.send_error(404)
+
+            def _complete(self):
+                time.sleep(stand_in.first_chunk_delay + stand_in.chunk_delay * (len(stand_in.chunks) - 1))
+                payload = json.dumps(_candidate("".join(stand_in.chunks))).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for index, text in enumerate(stand_in.chunks):
+                    time.sleep(stand_in.first_chunk_delay if index == 0 else stand_in.chunk_delay)
+                    event = f"data: {json.dumps(_candidate(text))}\r\n\r\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def load_wav_pcm(path, rate):
+    """16-bit mono PCM from a WAV file (first channel kept, resampled by nearest sample if needed)"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV fixtures are supported")
+        channels, source_rate = wav.getnchannels(), wav.getframerate()
+        samples = array("h")
+        samples.frombytes(wav.readframes(wav.getnframes()))
+    samples = samples[::channels]
+    if source_rate != rate:
+        count = int(len(samples) * rate / source_rate)
+        samples = array("h", (samples[int(i * source_rate / rate)] for i in range(count)))
+    return samples.tobytes()
+
+
+class FakeAudioDevice:
+    """Stand-in for main.MicStream: writes quiet room noise, or queued WAV fixtures, into the real ring buffer.
+
+    Audio is produced in real time (divided by speed) one chunk at a time, the way the
+    PortAudio callback would deliver it.
+    """
+
+    def __init__(self, speed=1.0, noise_rms=30):
+        import main
+        self.rate = main.SAMPLE_RATE
+        self.chunk = main.CHUNK
+        self.ring = main.AudioRingBuffer(int(self.rate * 2 * main.MIC_BUFFER_SECONDS))
+        self._reader_class = main.MicReader
+        self.speed = speed
+        self.noise_rms = noise_rms
+        self.pending = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.random = random.Random(0)
+
+    def ensure_started(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._feed, name="fake-audio-device", daemon=True)
+            self.thread.start()
+
+    def position(self):
+        return self.ring.write_pos
+
+    def reader(self, start_pos=None):
+        return self._reader_class(self.ring, self.ring.write_pos if start_pos is None else start_pos)
+
+    def stop(self):
+        self.stopped.set()
+
+    def play(self, pcm, on_start=None):
+        """Queue a fixture; on_start runs just before its first chunk is written. Returns a done event."""
+        done = threading.Event()
+        self.pending.put((pcm, on_start, done))
+        return done
+
+    def _noise(self, samples):
+        level = self.noise_rms
+        return array("h", (int(self.random.gauss(0, level)) for _ in range(samples))).tobytes()
+
+    def _feed(self):
+        chunk_bytes = self.chunk * 2
+        interval = self.chunk / self.rate / self.speed
+        next_at = time.monotonic()
+        current, offset, done = None, 0, None
+        while not self.stopped.is_set():
+            if current is None:
+                try:
+                    current, on_start, done = self.pending.get_nowait()
+                    offset = 0
+                    if on_start:
+                        on_start()
+                except queue.Empty:
+                    pass
+            if current is not None:
+                data = current[offset:offset + chunk_bytes]
+                offset += chunk_bytes
+                if len(data) < chunk_bytes:
+                    data += self._noise((chunk_bytes - len(data)) // 2)
+                if offset >= len(current):
+                    current = None
+                    done.set()
+            else:
+                data = self._noise(self.chunk)
+            self.ring.write(data)
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+
+class FakeWakeDetector:
+    """Stand-in for PorcupineWakeDetector: reports the wake word on the first frame after trigger()"""
+
+    frame_length = 512
+
+    def __init__(self):
+        self.triggered = threading.Event()
+
+    def trigger(self):
+        self.triggered.set()
+
+    def process(self, pcm):
+        if self.triggered.is_set():
+            self.triggered.clear()
+            return True
+        return False
+
+
+class FakeTranscriber:
+    """Stand-in for transcribe_audio: returns the expected transcript after a fixed decode delay"""
+
+    def __init__(self, delay=0.25, text="What's the weather like today?"):
+        self.delay = delay
+        self.text = text
+
+    def expect(self, text):
+        self.text = text
+
+    def __call__(self, recording):
+        time.sleep(self.delay)
+        return self.text if recording.pcm else ""
+
+
+class FakeSpeech:
+    """SpeechStream look-alike whose MP3 chunks arrive on a schedule starting when it is created"""
+
+    def __init__(self, text, first_chunk_delay, chunk_delay, chunks, seconds):
+        self.text = text
+        self.created_at = time.monotonic()
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_count = chunks
+        self.seconds = seconds  # How long the utterance would take to say
+        self.from_cache = False
+        self.failed = False
+        self.cancelled = threading.Event()
+
+    def __iter__(self):
+        for index in range(self.chunk_count):
+            due = self.created_at + self.first_chunk_delay + index * self.chunk_delay
+            if self.cancelled.wait(max(0.0, due - time.monotonic())):
+                return
+            yield b"\xff\xf3" + bytes(254)
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class FakeSynthesizer:
+    """Stand-in for SpeechStream: one FakeSpeech per sentence"""
+
+    def __init__(self, first_chunk_delay=0.15, chunk_delay=0.02, chunks=8, chars_per_second=15.0):
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.chars_per_second = chars_per_second
+
+    def __call__(self, text):
+        return FakeSpeech(text, self.first_chunk_delay, self.chunk_delay, self.chunks,
+                          len(text) / self.chars_per_second)
+
+
+class FakeSpeaker:
+    """Stand-in for _play_speech: "plays" each chunk for its share of the utterance, honouring stop()"""
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+
+    def __call__(self, speech, handle):
+        per_chunk = speech.seconds / max(1, speech.chunk_count) / self.speed
+        for _ in speech:
+            if handle.stopped:
+                break
+            handle.mark_first_audio()
+            handle.playing = True
+            if handle.stop_event.wait(per_chunk):
+                break
+        handle.playing = False
+        if handle.stopped:
+            handle.silenced.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the assistant's services")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.2, help="seconds before the first chunk")
+    args = parser.parse_args()
+
+    fake = FakeGeminiServer(chunk_delay=args.chunk_delay, first_chunk_delay=args.first_chunk_delay, port=args.port)
+    print(f"🧪 Fake Gemini listening on {fake.base_url} (set GEMINI_API_BASE to this URL)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
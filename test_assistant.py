@@ -0,0 +1,671 @@
+"""
+Headless tests for the assistant's pure-logic pieces (no microphone, network or display).
+
+    python -m unittest test_assistant
+"""
+import ctypes
+import math
+import os
+import tempfile
+import threading
+import time
+import unittest
+from array import array
+from concurrent.futures import Future
+from unittest import mock
+
+import requests
+from PIL import Image
+
+# Keep test turns out of the real conversation history (read by main at import time)
+os.environ["ASSISTANT_CONVERSATION_DB"] = os.path.join(tempfile.mkdtemp(prefix="test-history-"), "conversation.db")
+
+import gif_workers
+import main
+
+RATE = main.SAMPLE_RATE
+
+
+def tone(seconds, amplitude=6000, freq=200):
+    return array("h", (int(amplitude * math.sin(2 * math.pi * freq * i / RATE))
+                       for i in range(int(RATE * seconds)))).tobytes()
+
+
+def silence(seconds):
+    return bytes(int(RATE * seconds) * 2)
+
+
+def chunks(pcm, size=main.CHUNK * 2):
+    for i in range(0, len(pcm), size):
+        yield pcm[i:i + size]
+
+
+class VadEndpointerTest(unittest.TestCase):
+    def run_endpointer(self, pcm, **kwargs):
+        endpointer = main.VadEndpointer(**kwargs)
+        fed = bytearray()
+        for chunk in chunks(pcm):
+            fed += chunk
+            if endpointer.process(chunk):
+                break
+        return endpointer, endpointer.build_recording(bytes(fed))
+
+    def test_stops_after_trailing_silence_and_trims_padding(self):
+        pcm = silence(0.5) + tone(1.0) + silence(2.0)
+        endpointer, recording = self.run_endpointer(pcm)
+        self.assertEqual(recording.ended_by, "silence")
+        self.assertAlmostEqual(recording.speech_start, 0.5, delta=0.05)
+        self.assertAlmostEqual(recording.speech_end, 1.5, delta=0.05)
+        self.assertGreaterEqual(recording.trailing_silence * 1000, main.VAD_TRAILING_SILENCE_MS)
+        expected_start = int((recording.speech_start * 1000 - main.VAD_PADDING_MS) * RATE * 2 / 1000) & ~1
+        self.assertEqual(endpointer.trim_start(), expected_start)
+        expected_ms = recording.speech_end * 1000 + main.VAD_PADDING_MS - expected_start / (RATE * 2) * 1000
+        self.assertAlmostEqual(len(recording.pcm) / (RATE * 2) * 1000, expected_ms, delta=20)
+
+    def test_onset_mask_ignores_preroll(self):
+        pcm = tone(0.3) + silence(0.6) + tone(0.8) + silence(1.0)
+        _, recording = self.run_endpointer(pcm, onset_mask_ms=300)
+        self.assertAlmostEqual(recording.speech_start, 0.9, delta=0.05)
+
+    def test_speech_right_after_the_preroll(self):
+        pcm = tone(0.3, amplitude=1500) + tone(1.0, amplitude=1500) + silence(1.5)  # RMS ~1060, no gap
+        endpointer, recording = self.run_endpointer(pcm, onset_mask_ms=300)
+        self.assertEqual(recording.ended_by, "silence")
+        self.assertAlmostEqual(recording.speech_start, 0.3, delta=0.07)
+        self.assertAlmostEqual(recording.speech_end, 1.3, delta=0.07)
+        self.assertEqual(endpointer.trim_start(), 0)
+
+    def test_no_speech(self):
+        endpointer, recording = self.run_endpointer(silence(main.VAD_ONSET_TIMEOUT + 1))
+        self.assertEqual(recording.ended_by, "no_speech")
+        self.assertFalse(recording.has_speech)
+        self.assertIsNone(endpointer.trim_start())
+
+
+class AudioRingBufferTest(unittest.TestCase):
+    def test_read_across_wraparound(self):
+        ring = main.AudioRingBuffer(10)
+        ring.write(b"abcdefgh")
+        ring.write(b"ijkl")
+        data, pos = ring.read(6, 6)
+        self.assertEqual(data, b"ghijkl")
+        self.assertEqual(pos, 12)
+
+    def test_slow_reader_skips_to_oldest_audio(self):
+        ring = main.AudioRingBuffer(8)
+        ring.write(b"abcdefgh")
+        ring.write(b"ijkl")
+        reader = main.MicReader(ring, 0)
+        self.assertEqual(reader.pos, 4)
+        self.assertEqual(reader.read(2), b"efgh")
+
+    def test_read_times_out_without_data(self):
+        ring = main.AudioRingBuffer(8)
+        self.assertEqual(ring.read(0, 4, timeout=0.01), (None, 0))
+
+
+class SplitSentencesTest(unittest.TestCase):
+    def test_streamed_deltas_become_sentences(self):
+        deltas = ["I missed you so ", "much today! Tell me", " everything. Ok"]
+        self.assertEqual(list(main.split_sentences(deltas)),
+                         ["I missed you so much today!", "Tell me everything.", "Ok"])
+
+    def test_short_sentences_are_merged(self):
+        self.assertEqual(list(main.split_sentences(["Hi. Hello there, how are you?"])),
+                         ["Hi. Hello there, how are you?"])
+
+    def test_leading_opener_is_its_own_unit(self):
+        deltas = ["Hey B", "abe, I missed you so much today! ", "Tell me everything."]
+        self.assertEqual(list(main.split_sentences(deltas, openers=("Hey Babe,",))),
+                         ["Hey Babe,", "I missed you so much today!", "Tell me everything."])
+
+    def test_opener_only_at_the_start(self):
+        self.assertEqual(list(main.split_sentences(["Well, Hey Babe, what now?"], openers=("Hey Babe,",))),
+                         ["Well, Hey Babe, what now?"])
+
+    def test_closes_upstream(self):
+        closed = []
+
+        def deltas():
+            try:
+                yield "First sentence here. "
+                yield "Second sentence here. "
+            finally:
+                closed.append(True)
+
+        sentences = main.split_sentences(deltas())
+        self.assertEqual(next(sentences), "First sentence here.")
+        sentences.close()
+        self.assertEqual(closed, [True])
+
+
+def http_response(status, body=b"{}"):
+    response = requests.Response()
+    response.status_code = status
+    response.url = "http://gemini.test/"
+    response.encoding = "utf-8"
+    response._content = body
+    response._content_consumed = True
+    return response
+
+
+class LLMClientTest(unittest.TestCase):
+    URL = "http://gemini.test/v1beta/models/test:generateContent"
+
+    def setUp(self):
+        self.client = main.LLMClient(base_url="http://gemini.test")
+        self.client.session.post = mock.Mock()
+        patcher = mock.patch.object(main, "LLM_RETRY_BASE", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_transient_status(self):
+        self.client.session.post.side_effect = [http_response(503), http_response(200, b'{"ok": true}')]
+        self.assertEqual(self.client.post_json(self.URL, {}), {"ok": True})
+        self.assertEqual(self.client.counters["retries"], 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.client.session.post.return_value = http_response(400)
+        with self.assertRaises(requests.HTTPError):
+            self.client.post_json(self.URL, {})
+        self.assertEqual(self.client.session.post.call_count, 1)
+
+    def test_client_error_is_closed_and_logged(self):
+        response = http_response(400, b'{"error": {"message": "API key not valid"}}')
+        response.close = mock.Mock()
+        self.client.session.post.return_value = response
+        with mock.patch("builtins.print") as printed, self.assertRaises(requests.HTTPError):
+            self.client.post_json(self.URL, {})
+        response.close.assert_called_once_with()
+        self.assertIn("API key not valid", printed.call_args[0][0])
+        self.assertFalse(self.client.active_responses)
+
+    def test_retries_stop_at_the_deadline(self):
+        self.client.session.post.return_value = http_response(503)
+        started = time.monotonic()
+        with mock.patch.object(main, "LLM_RETRY_BASE", 10):
+            with self.assertRaises(main._RetryableStatus):
+                self.client.post_json(self.URL, {}, deadline=0.2)
+        self.assertLess(time.monotonic() - started, 1)  # The 10 s backoff is cut short
+
+    def test_stream_lines(self):
+        self.client.session.post.return_value = http_response(200, b'data: {"a": 1}\n\ndata: {"b": 2}\n')
+        self.assertEqual(list(self.client.stream_lines(self.URL, {})), ['data: {"a": 1}', "", 'data: {"b": 2}'])
+
+    def test_no_backoff_after_the_last_attempt(self):
+        self.client.session.post.return_value = http_response(503)
+        with mock.patch.object(main.random, "uniform", return_value=0.0) as backoff:
+            with self.assertRaises(main._RetryableStatus):
+                self.client.post_json(self.URL, {})
+        self.assertEqual(self.client.session.post.call_count, main.LLM_MAX_RETRIES + 1)
+        self.assertEqual(backoff.call_count, main.LLM_MAX_RETRIES)
+
+
+class TTSCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="test-tts-")
+
+    def test_round_trip_and_stats(self):
+        cache = main.TTSCache(cache_dir=self.dir)
+        self.assertIsNone(cache.get_bytes("hello"))
+        cache.put_bytes("hello", b"mp3data")
+        self.assertEqual(cache.get_bytes("hello"), b"mp3data")
+        reopened = main.TTSCache(cache_dir=self.dir)
+        self.assertEqual(reopened.get_bytes("hello"), b"mp3data")
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_peek_path_is_not_counted(self):
+        cache = main.TTSCache(cache_dir=self.dir)
+        self.assertIsNone(cache.peek_path("hello"))
+        path = cache.put_bytes("hello", b"mp3data")
+        self.assertEqual(cache.peek_path("hello"), path)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (0, 0))
+
+    def test_key_depends_on_voice_settings(self):
+        self.assertNotEqual(main.TTSCache.key("hi"), main.TTSCache.key("hi", voice="en-GB-SoniaNeural"))
+        self.assertEqual(main.TTSCache.key("hi "), main.TTSCache.key("hi"))
+
+    def test_disk_budget_evicts_least_recently_used(self):
+        cache = main.TTSCache(cache_dir=self.dir, max_disk_bytes=20, max_memory_bytes=0)
+        cache.put_bytes("one", b"x" * 8)
+        cache.put_bytes("two", b"y" * 8)
+        self.assertIsNotNone(cache.get_bytes("one"))  # "two" is now the oldest
+        cache.put_bytes("three", b"z" * 8)
+        self.assertIsNone(cache.get_bytes("two"))
+        self.assertEqual(cache.get_bytes("one"), b"x" * 8)
+        self.assertFalse(os.path.exists(cache.path_for(cache.key("two"))))
+
+    def test_missing_file_is_a_miss(self):
+        cache = main.TTSCache(cache_dir=self.dir, max_memory_bytes=0)
+        cache.put_bytes("gone", b"data")
+        os.remove(cache.path_for(cache.key("gone")))
+        self.assertIsNone(cache.get_bytes("gone"))
+
+
+class FakePorcupine:
+    """Stand-in for a pvporcupine handle: hears its keyword in frames whose loudest sample passes 20000"""
+
+    frame_length = 512
+
+    def __init__(self, fast=True):
+        self.fast_calls = 0
+        if fast:
+            self._handle = ctypes.c_void_p(1)
+            self._process_func = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_short),
+                                                  ctypes.POINTER(ctypes.c_int))(self._c_process)
+
+    def detect(self, samples):
+        loudest = max(range(self.frame_length), key=lambda i: samples[i])
+        return loudest % 3 if samples[loudest] > 20000 else -1
+
+    def process(self, samples):
+        return self.detect(list(samples))
+
+    def _c_process(self, handle, samples, result):
+        self.fast_calls += 1
+        result[0] = self.detect(samples)
+        return 0
+
+
+class PorcupineWakeDetectorTest(unittest.TestCase):
+    def frames(self):
+        frames = [os.urandom(FakePorcupine.frame_length * 2) for _ in range(20)]
+        return frames + [tone(FakePorcupine.frame_length / RATE, amplitude=25000), silence(FakePorcupine.frame_length / RATE)]
+
+    def test_fast_path_agrees_with_process(self):
+        porcupine = FakePorcupine()
+        detector = main.PorcupineWakeDetector(porcupine)
+        for pcm in self.frames():
+            self.assertEqual(detector.keyword_index(pcm), porcupine.process(main.pcm_to_samples(pcm)))
+        self.assertEqual(porcupine.fast_calls, len(self.frames()))
+
+    def test_falls_back_to_process_without_the_c_entry_point(self):
+        porcupine = FakePorcupine(fast=False)
+        detector = main.PorcupineWakeDetector(porcupine)
+        self.assertIsNone(detector.fast_process)
+        self.assertEqual([detector.process(pcm) for pcm in self.frames()[-2:]], [True, False])
+
+
+class BargeInTest(unittest.TestCase):
+    def test_barge_in_cancels_the_reply_in_flight(self):
+        pipeline = main.Pipeline(wake_detector=mock.Mock(frame_length=512))
+        events = []
+        pipeline.add_listener(lambda event, data: events.append(event))
+        turn = main.Turn(0)
+        turn.handle = main.PlaybackHandle()
+        pipeline.active_turn = turn
+        speech = mock.Mock()
+        pipeline.tts_queue.put((turn, "Tell me everything."))
+        pipeline.playback_queue.put((turn, speech))
+        with mock.patch.object(main.llm_client, "cancel_active") as cancel_active:
+            pipeline.barge_in(turn)
+        cancel_active.assert_called_once_with()
+        self.assertTrue(turn.cancelled.is_set())
+        self.assertIsNone(pipeline.active_turn)
+        self.assertTrue(pipeline.tts_queue.empty() and pipeline.playback_queue.empty())
+        speech.cancel.assert_called_once_with()
+        self.assertTrue(turn.handle.stopped)
+        self.assertEqual(events, ["barge_in"])
+        self.assertEqual(len(pipeline.barge_in_latencies), 1)
+
+
+class ConversationTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix="test-conversation-"), "conversation.db")
+
+    def context(self, **kwargs):
+        return main.ConversationContext(store=main.ConversationStore(self.path), **kwargs)
+
+    def test_turns_survive_a_restart(self):
+        context = self.context()
+        context.add_user("what's for dinner?")
+        context.add_model("Pasta, obviously.")
+        context.store.close()
+        restored = self.context()
+        self.assertEqual([turn["parts"][0]["text"] for turn in restored.turns],
+                         ["what's for dinner?", "Pasta, obviously."])
+
+    def test_recalls_older_exchange_outside_the_context(self):
+        context = self.context(token_budget=40, summary_budget=10)
+        context.add_user("my dog is called Rex")
+        context.add_model("Rex is a lovely name")
+        for i in range(4):
+            context.add_user(f"tell me about the weather forecast number {i}")
+            context.add_model("sunny and warm all day long today")
+        context.add_user("what is my dog called again?")
+        self.assertEqual(len(context.recalled), 1)
+        self.assertIn("Rex", context.recalled[0])
+        self.assertIn("Related things said in past conversations", context.payload()["systemInstruction"]["parts"][0]["text"])
+
+    def test_summarized_turns_are_not_recalled(self):
+        context = self.context(token_budget=25)
+        context.add_user("my dog is called Rex")
+        context.add_model("Rex is a lovely name")
+        context.add_user("tell me about the weather forecast today")
+        context.add_model("sunny and warm all day long today")
+        context.add_user("what is my dog called again?")
+        self.assertTrue(any("Rex" in line for line in context.summary))
+        self.assertEqual(context.recalled, [])
+        system_text = context.payload()["systemInstruction"]["parts"][0]["text"]
+        self.assertEqual(system_text.count("my dog is called Rex"), 1)
+
+    def test_history_stays_within_budget(self):
+        context = main.ConversationContext(token_budget=50, summary_budget=20)
+        for i in range(20):
+            context.add_user(f"question number {i} about something long enough")
+            context.add_model(f"answer number {i} about something long enough")
+        self.assertLessEqual(context.history_tokens(), 50)
+        self.assertEqual(context.turns[0]["role"], "user")
+        self.assertTrue(len(context.summary) == 1 or context.summary_tokens() <= 20)
+
+    def test_persona_is_sent_once_as_system_instruction(self):
+        context = main.ConversationContext(persona="You are Liebe.")
+        context.add_user("hi")
+        payload = context.payload()
+        self.assertEqual(payload["systemInstruction"]["parts"][0]["text"], "You are Liebe.")
+        self.assertEqual(payload["contents"], [{"role": "user", "parts": [{"text": "hi"}]}])
+
+
+def write_gif(path, colors, size=(40, 60), duration=100):
+    frames = [Image.new("RGB", size, color) for color in colors]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+
+
+class FrameCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="test-frames-")
+        self.gif = os.path.join(self.dir, "idle.gif")
+        write_gif(self.gif, ["red", "blue"], duration=120)
+        self.cache = main.FrameCache(cache_dir=self.dir)
+
+    def test_round_trip(self):
+        frames = main.CompactFrames.from_images([Image.new("RGB", (20, 30), color) for color in ("red", "blue")],
+                                                [120, 80], (20, 30))
+        self.assertIsNone(self.cache.load(self.gif, (20, 30)))
+        self.cache.store(self.gif, (20, 30), frames)
+        loaded = self.cache.load(self.gif, (20, 30))
+        self.assertEqual(loaded.durations, [120, 80])
+        self.assertEqual([loaded.image(i).convert("RGB").tobytes() for i in range(len(loaded))],
+                         [frames.image(i).convert("RGB").tobytes() for i in range(len(frames))])
+
+    def test_edited_gif_or_new_size_misses(self):
+        frames = main.CompactFrames.from_images([Image.new("RGB", (20, 30), "red")], [100], (20, 30))
+        self.cache.store(self.gif, (20, 30), frames)
+        self.assertIsNone(self.cache.load(self.gif, (10, 15)))
+        write_gif(self.gif, ["green", "blue", "red"])
+        self.assertIsNone(self.cache.load(self.gif, (20, 30)))
+
+
+class CompactFramesTest(unittest.TestCase):
+    def test_transparent_pixels_become_black(self):
+        image = Image.new("RGBA", (4, 4), (255, 0, 0, 255))
+        image.putpixel((0, 0), (255, 255, 255, 0))
+        frames = main.CompactFrames.from_images([image], [100], (4, 4))
+        rgb = frames.image(0).convert("RGB")
+        self.assertEqual(rgb.getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(rgb.getpixel((1, 1)), (255, 0, 0))
+        self.assertEqual(frames.nbytes, 4 * 4 + main.CompactFrames.PALETTE_BYTES)
+
+    def test_identical_frames_share_a_key(self):
+        images = [Image.new("RGB", (4, 4), color) for color in ("red", "red", "blue")]
+        keys = main.CompactFrames.from_images(images, [100] * 3, (4, 4)).keys()
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[1], keys[2])
+
+    def test_key_covers_the_whole_palette(self):
+        palette = bytes(main.CompactFrames.PALETTE_BYTES)
+        recoloured = palette[:-3] + b"\xff\xff\xff"
+        frames = main.CompactFrames((2, 2), [100, 100], palette + recoloured, bytes([255] * 4) * 2)
+        keys = frames.keys()
+        self.assertNotEqual(keys[0], keys[1])
+
+
+class GifOptimizerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="test-gifs-")
+        patcher = mock.patch.object(main, "GIF_OPTIMIZE_MANIFEST", os.path.join(self.dir, "manifest.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.input = os.path.join(self.dir, "idle.gif")
+        self.output = os.path.join(self.dir, "idle_optimized.gif")
+        write_gif(self.input, ["red", "blue", "green"])
+
+    def optimize(self):
+        return main.optimize_gifs([(self.input, self.output)], target_size=(20, 30), fps=10, colors=16, workers=1)
+
+    def test_runs_of_identical_frames_merge(self):
+        frames = [(b"a", b"A"), (b"a", b"A"), (b"b", b"B"), (b"a", b"A")]
+        self.assertEqual(main._merge_duplicate_frames(frames, 100), ([b"A", b"B", b"A"], [200, 100, 100]))
+
+    def test_transparent_pixels_become_black(self):
+        image = Image.new("RGBA", (4, 4), (255, 0, 0, 255))
+        image.putpixel((0, 0), (255, 255, 255, 0))
+        image.save(self.input)
+        frames, _ = gif_workers.decode_gif(self.input, (4, 4))
+        rgb = Image.frombytes("RGB", (4, 4), frames[0][1])
+        self.assertEqual(rgb.getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(rgb.getpixel((2, 2)), (255, 0, 0))
+
+    def test_unchanged_inputs_are_skipped(self):
+        self.assertEqual(self.optimize()["optimized"], 1)
+        with Image.open(self.output) as gif:
+            self.assertEqual((gif.size, gif.n_frames), ((20, 30), 3))
+        self.assertEqual(self.optimize()["skipped"], 1)
+        os.utime(self.input, ns=(0, 0))  # Touched but identical: the content hash still matches
+        self.assertEqual(self.optimize()["skipped"], 1)
+        write_gif(self.input, ["blue", "red"])
+        self.assertEqual(self.optimize()["optimized"], 1)
+
+
+def tone_segments(wav_bytes, threads):
+    """Stand-in for whisper-cli: one segment per run of tone, named after its length"""
+    samples = array("h", wav_bytes[44:])
+    step = RATE // 100
+    loud = [max(map(abs, samples[i:i + step])) > 1000 for i in range(0, len(samples), step)]
+    segments, start = [], None
+    for index, is_loud in enumerate(loud + [False]):
+        if is_loud and start is None:
+            start = index
+        elif not is_loud and start is not None:
+            segments.append((start / 100, index / 100, f"{(index - start) / 100:.1f} seconds"))
+            start = None
+    return segments
+
+
+class TranscriptionSchedulerTest(unittest.TestCase):
+    def stand_in_decoder(self, decode=tone_segments):
+        """Route every decode to decode() for the rest of the test"""
+        for patcher in (mock.patch.object(main, "WHISPER_SERVER_PATH", os.path.join(tempfile.mkdtemp(), "missing")),
+                        mock.patch.object(main, "_cli_segments", side_effect=decode)):
+            patched = patcher.start()
+            self.addCleanup(patcher.stop)
+        return patched
+
+    def transcribe(self, seconds, decode=tone_segments):
+        segments = self.stand_in_decoder(decode)
+        scheduler = main.TranscriptionScheduler(decoders=1)
+        with scheduler.cond:  # Queue every clip before the decoder picks up the first one
+            futures = [scheduler.submit(tone(length)) for length in seconds]
+        texts = [future.result(timeout=10) for future in futures]
+        scheduler.close()
+        return texts, segments.call_count, scheduler.stats()
+
+    def test_short_clips_share_one_decode(self):
+        texts, decodes, stats = self.transcribe([1.0, 1.5, 2.0])
+        self.assertEqual(texts, ["1.0 seconds", "1.5 seconds", "2.0 seconds"])
+        self.assertEqual(decodes, 1)
+        self.assertEqual(stats["clips"], 3)
+
+    def test_long_clips_are_decoded_alone(self):
+        texts, decodes, _ = self.transcribe([5.0, 1.0])
+        self.assertEqual(texts, ["5.0 seconds", "1.0 seconds"])
+        self.assertEqual(decodes, 2)
+
+    def test_segment_across_a_gap_redecodes_both_clips(self):
+        def decode(wav_bytes, threads):
+            seconds = (len(wav_bytes) - 44) / (RATE * 2)
+            if seconds > 3:  # The batch: whisper runs one segment across the gap
+                return [(0.0, seconds, "1.0 seconds 1.5 seconds")]
+            return tone_segments(wav_bytes, threads)
+
+        texts, decodes, stats = self.transcribe([1.0, 1.5], decode)
+        self.assertEqual(texts, ["1.0 seconds", "1.5 seconds"])
+        self.assertEqual((decodes, stats["redecoded"]), (3, 2))
+
+    def test_needs_a_decoder(self):
+        with self.assertRaises(ValueError):
+            main.TranscriptionScheduler(decoders=0)
+
+    def test_wav_files_are_read_by_the_decoder(self):
+        folder = tempfile.mkdtemp(prefix="test-clips-")
+        paths = []
+        for seconds in (1.0, 2.0):
+            paths.append(os.path.join(folder, f"{seconds}.wav"))
+            with open(paths[-1], "wb") as f:
+                f.write(main.pcm_to_wav_bytes(tone(seconds)))
+        self.stand_in_decoder()
+        with mock.patch.object(main, "_audio_to_pcm", wraps=main._audio_to_pcm) as read:
+            scheduler = main.TranscriptionScheduler(decoders=1)
+            with scheduler.cond:
+                futures = [scheduler.submit(path) for path in paths]
+                self.assertEqual(read.call_count, 0)
+            texts = [future.result(timeout=10) for future in futures]
+            scheduler.close()
+        self.assertEqual(texts, ["1.0 seconds", "2.0 seconds"])
+        self.assertEqual(read.call_count, 2)
+
+    def test_submit_waits_for_room_in_the_queue(self):
+        release = threading.Event()
+
+        def decode(wav_bytes, threads):
+            release.wait(10)
+            return tone_segments(wav_bytes, threads)
+
+        self.stand_in_decoder(decode)
+        scheduler = main.TranscriptionScheduler(decoders=1, max_pending=1)
+        futures = [scheduler.submit(tone(1.0)), scheduler.submit(tone(1.5))]  # One decoding, one queued
+        submitter = threading.Thread(target=lambda: futures.append(scheduler.submit(tone(2.0))))
+        submitter.start()
+        submitter.join(0.3)
+        self.assertTrue(submitter.is_alive())
+        release.set()
+        submitter.join(10)
+        texts = [future.result(timeout=10) for future in futures]
+        scheduler.close()
+        self.assertEqual(texts, ["1.0 seconds", "1.5 seconds", "2.0 seconds"])
+
+
+class StreamingTranscriberTest(unittest.TestCase):
+    def test_window_starts_where_the_recording_is_trimmed(self):
+        windows = []
+
+        def decode(wav_bytes):
+            windows.append(len(wav_bytes) - 44)
+            return [(0.0, 1.0, "turn on the lights")]
+
+        endpointer = main.VadEndpointer(onset_mask_ms=300)
+        stream = main.StreamingTranscriber(decode_segments=decode)
+        fed = bytearray()
+        for chunk in chunks(tone(0.3) + silence(0.8) + tone(1.5) + silence(1.2)):
+            fed += chunk
+            finished = endpointer.process(chunk)
+            stream.feed(chunk, endpointer.trim_start())
+            if finished:
+                break
+        recording = endpointer.build_recording(bytes(fed))
+        self.assertEqual(stream.finish(recording), "turn on the lights")
+        self.assertEqual(windows[-1], len(recording.pcm))
+
+    def test_agreeing_hypotheses_skip_the_final_decode(self):
+        stream = main.StreamingTranscriber(decode_segments=lambda wav: [(0.0, 1.0, "hello there")])
+        stream.done.set()  # Drive decodes by hand
+        stream.feed(tone(1.0) + silence(1.0))
+        stream._decode(len(stream.buffer))
+        stream._decode(len(stream.buffer))
+        self.assertEqual(stream.stable_text, "hello there")
+        recording = main.Recording(b"x", 2.0, speech_start=0.0, speech_end=1.0, ended_by="silence")
+        self.assertEqual(stream.finish(recording), "hello there")
+        self.assertFalse(stream.final_decode)
+        self.assertEqual(stream.decodes, 2)
+
+    def test_partials_only_commit_agreed_words(self):
+        hypotheses = iter([[(0.0, 1.0, "turn on")], [(0.0, 1.0, "turn off the")], [(0.0, 1.0, "turn off the light")]])
+        stream = main.StreamingTranscriber(decode_segments=lambda wav: next(hypotheses))
+        stream.done.set()
+        stream.feed(tone(2.0))
+        stable = []
+        for _ in range(3):
+            stream._decode(len(stream.buffer))
+            stable.append(stream.stable_text)
+        self.assertEqual(stable, ["", "turn", "turn off the"])
+
+
+def resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class SpeechStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = main.TTSCache(cache_dir=tempfile.mkdtemp(prefix="test-tts-"))
+        self.runtime = mock.Mock()
+        self.local = mock.Mock()
+        self.local.available.return_value = True
+        stand_ins = {"tts_cache": self.cache, "tts_runtime": self.runtime, "local_tts": self.local,
+                     "tts_hedge_stats": main.TTSHedgeStats(), "TTS_HEDGE_DELAY_MS": 50, "TTS_DEADLINE_MS": 300}
+        for name, value in stand_ins.items():
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_fast_edge_tts_is_not_hedged(self):
+        def edge(text, on_chunk=None):
+            on_chunk(b"edge")
+            return resolved(b"edge")
+
+        self.runtime.synthesize.side_effect = edge
+        speech = main.SpeechStream("Tell me everything.")
+        self.assertEqual(list(speech), [b"edge"])
+        self.assertEqual((speech.winner, speech.hedged), ("edge", False))
+        self.local.synthesize.assert_not_called()
+        self.assertEqual(self.cache.get_bytes("Tell me everything."), b"edge")
+
+    def test_local_voice_wins_when_edge_tts_is_silent(self):
+        self.runtime.synthesize.return_value = Future()
+        self.local.synthesize.return_value = resolved(b"local")
+        speech = main.SpeechStream("Tell me everything.")
+        self.assertEqual(list(speech), [b"local"])
+        self.assertEqual((speech.winner, speech.hedged, speech.audio_format), ("local", True, None))
+        self.assertTrue(speech.future.cancelled())
+        self.assertEqual(main.tts_hedge_stats.stats()["wins"], {"local": 1})
+
+    def test_gives_up_at_the_deadline(self):
+        self.runtime.synthesize.return_value = Future()
+        self.local.synthesize.return_value = Future()
+        started = time.monotonic()
+        speech = main.SpeechStream("Tell me everything.")
+        self.assertEqual(list(speech), [])
+        self.assertTrue(speech.failed and speech.hedged)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_presynthesis_is_not_hedged(self):
+        def slow_edge(text, on_chunk=None):
+            future = Future()
+
+            def deliver():
+                on_chunk(b"opener")
+                future.set_result(b"opener")
+
+            threading.Timer(0.5, deliver).start()  # Slower than the playback deadline
+            return future
+
+        self.runtime.synthesize.side_effect = slow_edge
+        self.cache.presynthesize(["Hey Babe,"], background=False)
+        self.assertEqual(self.cache.get_bytes("Hey Babe,"), b"opener")
+        self.local.synthesize.assert_not_called()
+        self.assertEqual(main.tts_hedge_stats.stats()["utterances"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()